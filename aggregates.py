@@ -0,0 +1,178 @@
+import resource
+
+import numpy as np
+import pandas as pd
+
+# Mergeable partial aggregates for out-of-core analysis. Chunks are folded into
+# per-group count, mean and sum of squared deviations (M2) plus a t-digest per
+# group for quantiles; partials of different chunks, files or machines merge
+# with Chan et al.'s pairwise formula (and digest merging), so no row has to be
+# kept once it has been folded. Unlike a sum of squares, M2 does not cancel
+# catastrophically for large, nearly constant counters.
+
+# Rough in-memory cost of one parsed cell including the parser's buffers, used
+# to size chunks from a memory cap
+BYTES_PER_CELL = 64
+MIN_CHUNK_ROWS = 1000
+DEFAULT_MEMORY_CAP_MB = 256
+DEFAULT_QUANTILES = [0.5, 0.95]
+
+
+class TDigest:
+    # Merging t-digest (Dunning & Ertl) with the k1 scale function. Centroids
+    # whose quantile range falls in the same unit of k are merged, so about
+    # `compression` / 2 centroids are kept however many values are added, with
+    # the finest resolution at the tails
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if len(values):
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.compress(np.concatenate([self.means, values]),
+                          np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if len(other.means):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        cluster = np.floor(k).astype('int64')
+        cluster = np.unique(cluster, return_inverse=True)[1]
+        self.weights = np.bincount(cluster, weights=weights)
+        self.means = np.bincount(cluster, weights=means * weights) / self.weights
+
+    def quantile(self, q):
+        if not len(self.means):
+            return np.nan
+        centers = np.cumsum(self.weights) - self.weights / 2
+        total = self.weights.sum()
+        return float(np.interp(q * total, np.concatenate([[0], centers, [total]]),
+                               np.concatenate([[self.min], self.means, [self.max]])))
+
+
+def merge_moments(a, b):
+    # Chan et al.: count, mean and M2 of the union of two sets of groups; a
+    # group missing from one side counts as empty there
+    a, b = a.align(b, join='outer')
+    na, nb = a['count'].fillna(0), b['count'].fillna(0)
+    n = na + nb
+    delta = b['mean'].fillna(0) - a['mean'].fillna(0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (a['mean'].fillna(0) * na + b['mean'].fillna(0) * nb) / n
+        m2 = a['m2'].fillna(0) + b['m2'].fillna(0) + delta ** 2 * na * nb / n
+    return pd.concat({'count': n, 'mean': mean, 'm2': m2.where(n > 0, 0)}, axis=1)
+
+
+def pool_moments(partials, keys):
+    # merge_moments over any number of partials: count, mean and M2 per group
+    # of `keys` of a frame holding one partial count/mean/m2 per row
+    group = [partials[key] for key in keys]
+    count = partials['count'].groupby(group, observed=True).transform('sum')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (partials['count'] * partials['mean'].fillna(0)).groupby(group, observed=True).transform('sum') / count
+    m2 = partials['m2'].fillna(0) + partials['count'] * (partials['mean'] - mean).fillna(0) ** 2
+    pooled = pd.DataFrame({'count': count, 'mean': mean, 'm2': m2})
+    return pooled.groupby(group, observed=True).agg({'count': 'first', 'mean': 'first', 'm2': 'sum'})
+
+
+class PartialAggregate:
+    # count, mean and M2 of `value_cols` per group of `keys`, plus a t-digest
+    # per group and column when quantiles are requested
+
+    def __init__(self, keys, value_cols, quantiles=(), compression=200):
+        self.keys = list(keys)
+        self.value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+        self.quantiles = list(quantiles)
+        self.compression = compression
+        self.stats = None
+        self.digests = {}
+
+    def fold(self, df):
+        if df.empty:
+            return self
+        values = df[self.value_cols].astype('float64')
+        group = [df[key] for key in self.keys]
+        grouped = values.groupby(group)
+        deviation = values - grouped.transform('mean')
+        partial = pd.concat({'count': grouped.count().astype('float64'), 'mean': grouped.mean(),
+                             'm2': (deviation ** 2).groupby(group).sum()}, axis=1)
+        self.stats = partial if self.stats is None else merge_moments(self.stats, partial)
+
+        if self.quantiles:
+            for key, group_values in values.groupby(group):
+                # Keys as they appear in the index of self.stats
+                if len(self.keys) == 1 and isinstance(key, tuple):
+                    key = key[0]
+                for column in self.value_cols:
+                    digest = self.digests.setdefault((key, column), TDigest(self.compression))
+                    digest.update(group_values[column].to_numpy())
+        return self
+
+    def merge(self, other):
+        if other.stats is not None:
+            self.stats = other.stats if self.stats is None else merge_moments(self.stats, other.stats)
+        for key, digest in other.digests.items():
+            if key in self.digests:
+                self.digests[key].merge(digest)
+            else:
+                self.digests[key] = digest
+        return self
+
+    def result(self, column):
+        # mean, std, sem, count and the requested quantiles (q50, q95, ...) of
+        # one value column per group
+        if self.stats is None:
+            return pd.DataFrame(columns=['mean', 'std', 'sem', 'count'])
+        count, mean, m2 = (self.stats[(stat, column)] for stat in ('count', 'mean', 'm2'))
+        count = count.where(count > 0)
+        data = pd.DataFrame({'mean': mean.where(count > 0)}, index=self.stats.index)
+        data['std'] = np.sqrt(m2 / (count - 1))
+        data['sem'] = data['std'] / np.sqrt(count)
+        data['count'] = count.fillna(0).astype('int64')
+        for q in self.quantiles:
+            data[f"q{round(q * 100):02d}"] = [self.digests[(key, column)].quantile(q)
+                                              if (key, column) in self.digests else np.nan
+                                              for key in data.index]
+        return data
+
+
+def chunk_rows(memory_cap_mb, n_columns):
+    # Rows per chunk so that one parsed chunk stays well inside the memory cap;
+    # the partial aggregates themselves only grow with the number of groups
+    rows = int(memory_cap_mb * 2 ** 20 / 4 / (BYTES_PER_CELL * max(n_columns, 1)))
+    return max(rows, MIN_CHUNK_ROWS)
+
+
+def peak_memory_mb():
+    # Peak resident set size of this process (ru_maxrss is in KiB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check_memory(memory_cap_mb, chunk_size):
+    # The cap only sizes the chunks; the partial aggregates (one row and digest
+    # per group), the run index and the interpreter itself come on top, so the
+    # peak is reported and a warning is printed when it went over the cap
+    peak = peak_memory_mb()
+    print(f"Aggregated in chunks of {chunk_size} rows, peak memory {peak:.0f} MB")
+    if peak > memory_cap_mb:
+        print(f"Warning: peak memory {peak:.0f} MB exceeded the memory cap of {memory_cap_mb:.0f} MB; the cap "
+              f"bounds each chunk, not the per-group aggregates, the run index or the interpreter")
+    return peak
@@ -0,0 +1,195 @@
+import argparse
+import os
+from functools import partial
+
+import matplotlib as mpl
+import numpy as np
+import pandas as pd
+
+from dataloader import load_archive
+from render import SVG_PROFILES, new_figure, render_all, save_figure, set_svg_profile
+
+HELP = 'Attribute runtime differences between branches to simulator counters'
+
+# Simulation runtime is regressed linearly on the counters separately for
+# every model (run type, location and model directory). All models are fitted
+# in one batch: their rows are padded into a (models, rows, counters) array
+# whose padding rows are zero, so they add nothing to any least-squares fit,
+# and the standardized systems are solved together with a stacked
+# pseudo-inverse. Counters that are constant within a model get no weight.
+RUNTIME = 'Simulation_Runtime_(secs.)'
+COUNTERS = [
+    'Primary_Rollbacks', 'Secondary_Rollbacks', 'Coast_Forwarded_Events', 'Cancelled_Events',
+    'Sched_Event_Swaps_Success', 'Sched_Event_Swaps_Failed', 'Events_for_Starved_Objects',
+    'Local_Positive_Events_Sent', 'Remote_Positive_Events_Sent', 'Local_Negative_Events_Sent',
+    'Remote_Negative_Events_Sent',
+]
+MODEL_KEYS = ['Run_Type', 'Location', 'Folder']
+CONFIG_KEYS = ['Worker_Thread_Count', 'State_Save_Period']
+DEFAULT_RIDGE = 0.1
+
+
+def pad_groups(df, keys, columns):
+    # (groups, rows, columns) array of the rows of every group plus the row mask
+    codes = df.groupby(keys, observed=True, sort=True).ngroup().to_numpy()
+    position = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    counts = np.bincount(codes)
+    values = np.zeros((len(counts), counts.max(), len(columns)))
+    values[codes, position] = df[columns].to_numpy(dtype='float64')
+    mask = np.zeros(values.shape[:2], dtype=bool)
+    mask[codes, position] = True
+    return values, mask, counts
+
+
+def fit_batched(X, y, mask, counts, ridge=0.0):
+    # Least squares of y on X with an intercept for every group at once. Rows
+    # are centered and scaled per group first, which keeps counters of very
+    # different magnitudes well conditioned. The counters are strongly
+    # correlated (rollbacks cause cancellations and coast-forwarding), so a
+    # ridge penalty of `ridge` per row on the standardized coefficients keeps
+    # them from cancelling each other out. Returns the coefficients in the
+    # units of X, the intercepts and R^2 per group
+    n = counts[:, None]
+    x_mean = X.sum(axis=1) / n
+    Z = (X - x_mean[:, None, :]) * mask[..., None]
+    scale = np.sqrt((Z ** 2).sum(axis=1) / n)
+    scale[scale == 0] = 1
+    Z /= scale[:, None, :]
+    y_mean = y.sum(axis=1) / counts
+    yc = (y - y_mean[:, None]) * mask
+
+    if ridge > 0:
+        gram = Z.transpose(0, 2, 1) @ Z + ridge * n[..., None] * np.eye(Z.shape[2])
+        coef = np.linalg.solve(gram, Z.transpose(0, 2, 1) @ yc[..., None])[..., 0]
+    else:
+        coef = (np.linalg.pinv(Z) @ yc[..., None])[..., 0]
+    residual = (yc - (Z @ coef[..., None])[..., 0]) * mask
+    total = (yc ** 2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1 - (residual ** 2).sum(axis=1) / total
+    coef /= scale
+    intercept = y_mean - (coef * x_mean).sum(axis=1)
+    return coef, intercept, r2
+
+
+def fit_models(df, keys, counters, ridge=0.0):
+    rows = df.dropna(subset=counters + [RUNTIME])
+    rows = rows.sort_values(keys, kind='stable')
+    X, mask, counts = pad_groups(rows, keys, counters + [RUNTIME])
+    coef, intercept, r2 = fit_batched(X[..., :-1], X[..., -1], mask, counts, ridge)
+    index = rows.groupby(keys, observed=True, sort=True).size().index
+    fits = pd.DataFrame(coef, index=index, columns=counters)
+    fits['Intercept'] = intercept
+    fits['R2'] = r2
+    fits['Runs'] = counts
+    return fits
+
+
+def attribute(df, fits, keys, counters, baseline):
+    # Difference of every branch's mean runtime to the baseline branch of the
+    # same group, split into coefficient * difference of mean counter per
+    # counter; what the fit does not explain is left in 'Unexplained'
+    means = df.groupby(keys + ['branch'], observed=True)[counters + [RUNTIME]].mean()
+    rows = []
+    for group, group_means in means.groupby(level=keys, observed=True, sort=False):
+        branches = group_means.index.get_level_values('branch')
+        base_branch = baseline if baseline in branches else branches[0]
+        base = group_means.xs(base_branch, level='branch').iloc[0]
+        coef = fits.loc[group, counters]
+        for branch, row in group_means.droplevel(keys).iterrows():
+            if branch == base_branch:
+                continue
+            contributions = coef * (row[counters] - base[counters])
+            difference = row[RUNTIME] - base[RUNTIME]
+            rows.append({**dict(zip(keys, group if isinstance(group, tuple) else (group,))),
+                         'branch': branch, 'Baseline': base_branch, 'Runtime_Difference': difference,
+                         **contributions.to_dict(), 'Unexplained': difference - contributions.sum()})
+    return pd.DataFrame(rows)
+
+
+def plot_group(group, rows, parts, colors, output_dir):
+    # One stacked bar per branch of a group: positive contributions stack up,
+    # negative ones down, and the observed difference is marked
+    group = group if isinstance(group, tuple) else (group,)
+    fig, ax = new_figure((max(8, 1.2 * len(rows) + 4), 8), style='whitegrid')
+    x = np.arange(len(rows))
+    values = rows[parts].to_numpy(dtype='float64')
+    positive = np.cumsum(np.clip(values, 0, None), axis=1) - np.clip(values, 0, None)
+    negative = np.cumsum(np.clip(values, None, 0), axis=1) - np.clip(values, None, 0)
+    for i, part in enumerate(parts):
+        bottom = np.where(values[:, i] >= 0, positive[:, i], negative[:, i])
+        ax.bar(x, values[:, i], 0.6, bottom=bottom, label=part, color=colors[part])
+    ax.scatter(x, rows['Runtime_Difference'], marker='D', color='black', zorder=3, label='Observed difference')
+    ax.axhline(0, color='black', linewidth=0.8)
+    ax.set_xticks(x)
+    ax.set_xticklabels(rows['branch'], rotation=45, ha='right', fontsize=11)
+    ax.set_ylabel(f"{RUNTIME} difference to {rows['Baseline'].iat[0]}", fontsize=12)
+    ax.set_title(f"Runtime attribution - {' - '.join(map(str, group))}", fontsize=14)
+    ax.legend(bbox_to_anchor=(1.02, 1), loc='upper left', fontsize=9)
+    fig.tight_layout()
+    name = '_'.join(str(value) for value in group)
+    filepath = save_figure(fig, os.path.join(output_dir, f"Attribution_{name}.svg"), dpi=300, bbox_inches='tight')
+    print(f"Saved plot to {filepath}")
+
+
+def plot_attribution(attribution, keys, counters, output_dir, workers=None):
+    # One figure per group, rendered on the thread pool. tab20 gives every
+    # counter its own colour (the default cycle repeats after 10); the
+    # unexplained part is grey
+    palette = mpl.colormaps['tab20'].colors
+    parts = counters + ['Unexplained']
+    colors = dict(zip(counters, palette)) | {'Unexplained': '0.6'}
+    render_all([partial(plot_group, group, rows, parts, colors, output_dir)
+                for group, rows in attribution.groupby(keys, sort=False)], workers)
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('--model', help='Only analyze model directories containing this keyword')
+    parser.add_argument('--svg', choices=SVG_PROFILES, default='default',
+                        help='SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)')
+    parser.add_argument('--latest', action='store_true', help='Only read the newest run directory of every run type')
+    parser.add_argument('--baseline', default='master',
+                        help='Branch the others are compared with (default master; else the first branch of a model)')
+    parser.add_argument('--ridge', type=float, default=DEFAULT_RIDGE,
+                        help=f'Ridge penalty on the standardized coefficients, 0 for plain least squares (default {DEFAULT_RIDGE})')
+    parser.add_argument('--per-config', action='store_true',
+                        help='Fit every thread count and State_Save_Period of a model separately')
+    parser.add_argument('--workers', type=int, help='Number of plots rendered at once (default: thread pool size)')
+
+
+def run(args):
+    set_svg_profile(args.svg)
+    keys = MODEL_KEYS + (CONFIG_KEYS if args.per_config else [])
+    df = load_archive(args.directory, args.model, set(COUNTERS + CONFIG_KEYS) | {'branch', RUNTIME},
+                      latest=args.latest)
+    if df is None:
+        return
+
+    output_dir = os.path.join(args.directory, 'Attribution')
+    os.makedirs(output_dir, exist_ok=True)
+
+    fits = fit_models(df, keys, COUNTERS, args.ridge)
+    attribution = attribute(df, fits, keys, COUNTERS, args.baseline)
+
+    with open(os.path.join(output_dir, 'attribution_data.txt'), 'w') as f:
+        f.write(f"Least-squares fit of {RUNTIME} on the counters per model, ridge {args.ridge} "
+                f"(coefficients in seconds per count)\n\n")
+        f.write(fits.reset_index().to_string(index=False))
+        f.write("\n\nRuntime difference to the baseline branch attributed to every counter\n\n")
+        f.write(attribution.to_string(index=False))
+        f.write("\n")
+    print(f"Fitted {len(fits)} models, median R^2 {fits['R2'].median():.3f}")
+
+    if not attribution.empty:
+        plot_attribution(attribution, keys, COUNTERS, output_dir, args.workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import gzip
+import os
+import shutil
+
+import numpy as np
+
+from dataloader import iter_archive, read_parallel, row_hashes
+
+HELP = 'Compress the result files of an archive in place'
+
+# Every plain <run type>/<model>/*.csv is written as .csv.gz (or .csv.zst when
+# the zstandard package is installed) next to the original, which is removed
+# once the compressed copy hashes to the same rows. The loaders read either
+# form, and the run identities of the RunIndex are unchanged by compression.
+FORMATS = ['gz', 'zst']
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def compress_file(csv_file, fmt):
+    target = f"{csv_file}.{fmt}"
+    with open(csv_file, 'rb') as src:
+        if fmt == 'zst':
+            import zstandard
+            with open(target + '.tmp', 'wb') as dst:
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst)
+        else:
+            with gzip.open(target + '.tmp', 'wb', compresslevel=GZIP_LEVEL) as dst:
+                shutil.copyfileobj(src, dst)
+    os.rename(target + '.tmp', target)
+
+    if not np.array_equal(row_hashes(csv_file), row_hashes(target)):
+        os.remove(target)
+        raise ValueError(f"{target} does not read back to the rows of {csv_file}")
+    os.remove(csv_file)
+    return target
+
+
+def compress_archive(root_dir, fmt='gz', workers=None):
+    csv_files = [csv_file for _, _, csv_file in iter_archive(root_dir) if csv_file.endswith('.csv')]
+    before = sum(os.path.getsize(csv_file) for csv_file in csv_files)
+    targets = read_parallel(lambda csv_file: compress_file(csv_file, fmt), csv_files, workers)
+    after = sum(os.path.getsize(target) for target in targets)
+    if targets:
+        print(f"Compressed {len(targets)} files from {before} to {after} bytes ({before / max(after, 1):.1f}x)")
+    else:
+        print(f"No uncompressed result files found below {root_dir}")
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('--format', choices=FORMATS, default='gz', help='Compression format (zst needs zstandard)')
+    parser.add_argument('--workers', type=int, help='Number of files compressed at once')
+
+
+def run(args):
+    compress_archive(args.directory, args.format, args.workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
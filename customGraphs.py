@@ -1,18 +1,19 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import hashlib
 import os
 import argparse
+from functools import partial
 from matplotlib.ticker import FuncFormatter
-import glob
 import numpy as np
+from plotspec import as_list, load_spec, group_configs
+from aggregates import DEFAULT_MEMORY_CAP_MB, DEFAULT_QUANTILES, PartialAggregate, chunk_rows, check_memory
+from dataloader import load_folders, stream_folders
+from query import ENGINES, sql_frame
+from preprocess import preprocess, step_names
+from render import SVG_PROFILES, new_figure, render_all, save_figure, set_svg_profile
 
-# Use a basic style that should be available in all matplotlib installations
-plt.style.use('default')
-
-# Set seaborn style manually
-sns.set_style("whitegrid")
-sns.set_palette("deep")
+# Every figure is drawn with seaborn's "whitegrid" look and "deep" palette
+STYLE = "whitegrid"
 
 colors = ["#ff9999", "#66b3ff", "#99ff99", "#ffcc99", "#ff99cc", "#99ffff", "#ff99ff", "#ffff99"]
 
@@ -31,7 +32,8 @@ plot_configs = [
         "y": "Simulation_Runtime_(secs.)",
         "title": "Branch vs Simulation Time",
         "type": "bar",
-        "agg": "mean"
+        "agg": "mean",
+        "baseline": "master"
     },
     {
         "groupby": ["Folder", "State_Save_Period"],
@@ -39,7 +41,8 @@ plot_configs = [
         "y": "Average_Memory_Usage_(MB)",
         "title": "Average Memory Usage vs Branch",
         "type": "bar",
-        "agg": "mean"
+        "agg": "mean",
+        "baseline": "master"
     },
     {
        "groupby": ["Folder", "State_Save_Period"],
@@ -47,7 +50,8 @@ plot_configs = [
         "y": "Primary_Rollbacks",
         "title": "Branch vs Primary Rollback",
         "type": "bar",
-        "agg": "mean" 
+        "agg": "mean",
+        "baseline": "master"
     },
     # {
     #    "groupby": "Worker_Thread_Count",
@@ -59,7 +63,29 @@ plot_configs = [
     # }
 ]
 
+# Aggregations a bar config's "agg" may ask for. Whichever is chosen, the bar
+# heights are kept in the 'mean' column and their standard errors in 'sem':
+# the sum is n * mean with error n * SEM, and the error of the median is taken
+# as sqrt(pi / 2) * SEM, its large-sample value for roughly normal iterations
+BAR_AGGS = ["mean", "sum", "median"]
+MEDIAN_SE_FACTOR = np.sqrt(np.pi / 2)
+
+def bar_agg(config):
+    agg = config.get("agg", "mean")
+    if agg not in BAR_AGGS:
+        raise ValueError(f"{config['title']}: unsupported agg {agg!r} for bar plots (expected one of {BAR_AGGS})")
+    return agg
+
+def bar_frame(stats, agg):
+    # stats holds mean, sem, count and median of one metric per cell
+    if agg == "sum":
+        return stats.assign(mean=stats["mean"] * stats["count"], sem=stats["sem"] * stats["count"])
+    if agg == "median":
+        return stats.assign(mean=stats["median"], sem=MEDIAN_SE_FACTOR * stats["sem"])
+    return stats
+
 def plothandler(dataframe, config, outputdir):
+    dataframe = preprocess(dataframe, config["groupby"] + [config["x"]], config["y"], config.get("preprocess"), config["title"])
     if config["type"]=="bar":
         create_grouped_bar_plot(dataframe, config["groupby"], config["y"], config["x"], outputdir, config)
     elif config["type"]=="line":
@@ -68,104 +94,127 @@ def plothandler(dataframe, config, outputdir):
         print("Invalid graph type")
 
 def create_grouped_bar_plot(df, group_cols, y_col, hue_col, outputdir, config):
-    df[y_col] = df[y_col].astype('float64')
+    df = df.assign(**{y_col: df[y_col].astype('float64')})
     
-    # Aggregate data based on multiple grouping columns
+    # Aggregate data based on multiple grouping columns; only observed
+    # combinations are kept, missing cells are never materialized
     agg_cols = group_cols + [hue_col]
-    df_agg = df.groupby(agg_cols)[y_col].agg(['mean', 'sem']).reset_index()
-    
-    # Create a complete index with all combinations
-    index_cols = [df[col].unique() for col in agg_cols]
-    complete_index = pd.MultiIndex.from_product(index_cols, names=agg_cols)
-    df_complete = df_agg.set_index(agg_cols).reindex(complete_index).reset_index()
-    
-    # Write data to text file
+    stats = df.groupby(agg_cols, observed=True, sort=False)[y_col].agg(['mean', 'sem', 'count', 'median'])
+    df_agg = bar_frame(stats, bar_agg(config))[['mean', 'sem']].reset_index()
+    write_and_plot(df_agg, group_cols, y_col, hue_col, outputdir, config)
+
+def write_and_plot(df_agg, group_cols, y_col, hue_col, outputdir, config):
+    # With a "baseline" branch in the config a normalized copy of the figures
+    # is drawn as well; without one only the raw figures are rendered
+    baseline = config.get("baseline")
+    df_norm = normalize_to_baseline(df_agg, group_cols, hue_col, baseline) if baseline else None
+
+    # Write data to text file, with the bar heights named by their aggregation
+    agg = bar_agg(config)
     txt_filename = os.path.join(outputdir, f"{config['title']}_data.txt")
     with open(txt_filename, 'w') as f:
         f.write(f"Data for plot: {config['title']}\n\n")
-        f.write(df_complete.to_string(index=False))
+        f.write(df_agg.rename(columns={'mean': agg}).to_string(index=False))
         f.write("\n\n")
+        if df_norm is not None:
+            f.write(f"Normalized to {baseline}\n\n")
+            f.write(df_norm.rename(columns={'mean': agg}).to_string(index=False))
+            f.write("\n\n")
     
     print(f"Data for {config['title']} has been written to {txt_filename}")
     
     # Create plots
-    create_plot(df_complete, group_cols, y_col, hue_col, outputdir, config, False)
-    create_plot(df_complete, group_cols, y_col, hue_col, outputdir, config, True)
+    create_plot(df_agg, group_cols, y_col, hue_col, outputdir, config)
+    if df_norm is not None:
+        create_plot(df_norm, group_cols, y_col, hue_col, outputdir, config, normalized=True)
+
+def normalize_to_baseline(df_agg, group_cols, hue_col, baseline):
+    # Divide every mean by the baseline branch's mean of the same group_cols
+    # cell, for all cells at once. The SEM of a ratio of independent means is
+    # sqrt(sem_a^2 + r^2 * sem_b^2) / |b|, which stays finite when a is 0; the
+    # baseline itself is exactly 1. Cells without the baseline branch have no
+    # normalized value
+    base = df_agg.loc[df_agg[hue_col] == baseline, group_cols + ['mean', 'sem']]
+    base = df_agg[group_cols].merge(base, on=group_cols, how='left')[['mean', 'sem']].to_numpy()
+    mean, sem = df_agg['mean'].to_numpy(), df_agg['sem'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = mean / base[:, 0]
+        ratio_sem = np.sqrt(sem ** 2 + ratio ** 2 * base[:, 1] ** 2) / np.abs(base[:, 0])
+    ratio_sem = np.where(df_agg[hue_col].to_numpy() == baseline, 0.0, ratio_sem)
+
+    missing = df_agg.loc[np.isnan(base[:, 0]), group_cols].drop_duplicates()
+    if not missing.empty:
+        print(f"No {baseline} runs to normalize {len(missing)} groups by: {missing.to_dict('records')}")
+    return df_agg[group_cols + [hue_col]].assign(mean=ratio, sem=ratio_sem)
 
-def create_plot(df_complete, group_cols, y_col, hue_col, outputdir, config, normalize):
+def align_group(group_df, x_col, hue_col):
+    # Lay out one figure's bars as an x by hue grid built from the cells present
+    # in this group only; absent cells are NaN and draw no bar
+    all_x = group_df[x_col].unique()
+    all_hue = group_df[hue_col].unique()
+    means = group_df.pivot(index=x_col, columns=hue_col, values='mean').reindex(index=all_x, columns=all_hue)
+    sems = group_df.pivot(index=x_col, columns=hue_col, values='sem').reindex(index=all_x, columns=all_hue)
+    return all_x, all_hue, means, sems
+
+def draw_grouped_bars(ax, all_x, all_hue, means, sems, show_errors=True):
+    n_hues = len(all_hue)
+    width = 0.8 / n_hues
+    x = np.arange(len(all_x))
+    for i, hue_val in enumerate(all_hue):
+        offset = width * (i - (n_hues - 1) / 2)
+        ax.bar(x + offset, means[hue_val], width, label=hue_val)
+        if show_errors:
+            ax.errorbar(x + offset, means[hue_val], yerr=sems[hue_val], fmt='none', c='black', capsize=5, elinewidth=1)
+    return x
+
+def create_plot(df_agg, group_cols, y_col, hue_col, outputdir, config, normalized=False):
     # Create separate plots for each combination of grouping variables
-    for group_values in df_complete.groupby(group_cols[:-1]):
+    for group_values in df_agg.groupby(group_cols[:-1], sort=False):
         group_df = group_values[1]
         group_name = "_".join([f"{col}_{val}" for col, val in zip(group_cols[:-1], group_values[0])])
         
-        plt.figure(figsize=(20, 10))
-        ax = plt.gca()
+        fig, ax = new_figure((20, 10), style=STYLE)
         
         x_col = group_cols[-1]  # Use the last grouping column as x-axis
-        all_x = group_df[x_col].unique()
-        all_hue = group_df[hue_col].unique()
-        n_hues = len(all_hue)
-        width = 0.8 / n_hues
-        x = np.arange(len(all_x))
-        
-        for i, hue_val in enumerate(all_hue):
-            hue_data = group_df[group_df[hue_col] == hue_val]
-            if normalize:
-                # Normalization logic (keep as is)
-                pass
-            
-            offset = width * (i - (n_hues - 1) / 2)
-            rects = ax.bar(x + offset, hue_data['mean'], width, label=hue_val)
-            if not normalize:
-                ax.errorbar(x + offset, hue_data['mean'], yerr=hue_data['sem'], fmt='none', c='black', capsize=5, elinewidth=1)
+        all_x, all_hue, means, sems = align_group(group_df, x_col, hue_col)
+        x = draw_grouped_bars(ax, all_x, all_hue, means, sems)
         
         # Set labels, title, and legend
-        ax.set_ylabel(f"Normalized {y_col}" if normalize else y_col, fontsize=16)
+        ax.set_ylabel(f"{y_col} relative to {config['baseline']}" if normalized else y_col, fontsize=16)
         ax.set_xlabel(x_col, fontsize=16)
-        ax.set_title(f"{config['title']} - {group_name} ({'Normalized' if normalize else 'Raw'})", fontsize=20)
+        ax.set_title(f"{config['title']} - {group_name} ({'Normalized' if normalized else 'Raw'})", fontsize=20)
         ax.set_xticks(x)
         ax.set_xticklabels(all_x, rotation=45, ha='right', fontsize=14)
         ax.tick_params(axis='y', labelsize=14)
         ax.legend(title=hue_col, bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=14, title_fontsize=16)
         
         # Y-axis formatting
-        if normalize:
-            ax.set_ylim(hue_data['mean'].min() - 0.1, hue_data['mean'].max() + 0.1)
+        if normalized:
+            ax.axhline(1, color='black', linewidth=1, linestyle='--')
         elif 'Memory' in y_col or 'Runtime' in y_col:
             ax.yaxis.set_major_formatter(FuncFormatter(format_y_axis))
         
-        plt.tight_layout()
-        plt.savefig(os.path.join(outputdir, f"{config['title']}_{group_name}_{'normalized' if normalize else 'raw'}.svg"), dpi=300, bbox_inches='tight')
-        plt.close()
+        fig.tight_layout()
+        save_figure(fig, os.path.join(outputdir, f"{config['title']}_{group_name}_{'normalized' if normalized else 'raw'}.svg"), dpi=300, bbox_inches='tight')
         
         # Create log scale plot if needed (only for non-normalized data)
-        if not normalize:
+        if not normalized:
             y_min, y_max = group_df['mean'].min(), group_df['mean'].max()
             if y_min > 0 and y_max / y_min > 1000:
                 create_log_plot(group_df, x_col, y_col, hue_col, outputdir, config, group_name)
 
 
 
-def create_log_plot(df_complete, x_col, y_col, hue_col, outputdir, config):
-    plt.figure(figsize=(20, 10))
-    ax = plt.gca()
+def create_log_plot(group_df, x_col, y_col, hue_col, outputdir, config, group_name):
+    fig, ax = new_figure((20, 10), style=STYLE)
     ax.set_yscale('log')
 
-    all_x = df_complete[x_col].unique()
-    all_hue = df_complete[hue_col].unique()
-    n_hues = len(all_hue)
-    width = 0.8 / n_hues
-    x = np.arange(len(all_x))
-
-    for i, hue_val in enumerate(all_hue):
-        hue_data = df_complete[df_complete[hue_col] == hue_val]
-        offset = width * (i - (n_hues - 1) / 2)
-        rects = ax.bar(x + offset, hue_data['mean'], width, label=hue_val)
-        ax.errorbar(x + offset, hue_data['mean'], yerr=hue_data['sem'], fmt='none', c='black', capsize=5, elinewidth=1)
+    all_x, all_hue, means, sems = align_group(group_df, x_col, hue_col)
+    x = draw_grouped_bars(ax, all_x, all_hue, means, sems)
 
     ax.set_ylabel(y_col, fontsize=16)
     ax.set_xlabel(x_col, fontsize=16)
-    ax.set_title(f"{config['title']} (Log Scale)", fontsize=20)
+    ax.set_title(f"{config['title']} - {group_name} (Log Scale)", fontsize=20)
     ax.set_xticks(x)
     ax.set_xticklabels(all_x, rotation=45, ha='right', fontsize=14)
     ax.tick_params(axis='y', labelsize=14)
@@ -174,17 +223,127 @@ def create_log_plot(df_complete, x_col, y_col, hue_col, outputdir, config):
     if 'Memory' in y_col or 'Runtime' in y_col:
         ax.yaxis.set_major_formatter(FuncFormatter(format_y_axis))
 
-    plt.tight_layout()
-    plt.savefig(os.path.join(outputdir, f"{config['title']}_{group_name}_log.svg"), dpi=300, bbox_inches='tight')
-    plt.close()
+    fig.tight_layout()
+    save_figure(fig, os.path.join(outputdir, f"{config['title']}_{group_name}_log.svg"), dpi=300, bbox_inches='tight')
+
+def dashboard_tasks(df, group, outputdir):
+    # Bar configs that share groupby and x are aggregated together and drawn as
+    # subplots of one figure per group; anything else is plotted as usual
+    tasks = []
+    dashboards = {}
+    for config in group["configs"]:
+        if config["type"] != "bar":
+            tasks.append(partial(plothandler, df, config, outputdir))
+            continue
+        key = (tuple(as_list(config["groupby"])), config["x"], repr(config.get("preprocess")))
+        dashboards.setdefault(key, []).append(config)
+
+    for (group_cols, hue_col, preprocess_key), metric_configs in dashboards.items():
+        # The file names tell apart dashboards of other groupings, preprocessing
+        # and filter groups, which are all written to the same directory
+        name = "_".join(group_cols + (hue_col, group["name"]))
+        if metric_configs[0].get("preprocess"):
+            name += "_" + hashlib.md5(preprocess_key.encode()).hexdigest()[:8]
+        tasks.append(partial(create_dashboard, df, list(group_cols), hue_col, metric_configs, outputdir, name))
+    return tasks
+
+def create_dashboard(df, group_cols, hue_col, configs, outputdir, name):
+    y_cols = list(dict.fromkeys(config["y"] for config in configs))
+    df = preprocess(df, group_cols + [hue_col], y_cols, configs[0].get("preprocess"), "Dashboard")
+    df = df.assign(**{col: df[col].astype('float64') for col in y_cols})
+
+    # A single groupby pass aggregates every metric of the dashboard; each
+    # subplot then takes the bars of its config's "agg" from these statistics
+    agg_cols = group_cols + [hue_col]
+    df_agg = df.groupby(agg_cols, observed=True, sort=False)[y_cols].agg(['mean', 'sem', 'count', 'median'])
+
+    txt_filename = os.path.join(outputdir, f"Dashboard_{name}_data.txt")
+    with open(txt_filename, 'w') as f:
+        f.write(f"Data for dashboard: {', '.join(config['title'] for config in configs)}\n\n")
+        f.write(df_agg.reset_index().to_string(index=False))
+        f.write("\n\n")
+    print(f"Data for dashboard has been written to {txt_filename}")
+
+    x_col = group_cols[-1]
+    # With a single groupby column every cell goes into one figure
+    groups = df_agg.groupby(level=group_cols[:-1], sort=False) if len(group_cols) > 1 else [((), df_agg)]
+    for group_values, group_agg in groups:
+        if not isinstance(group_values, tuple):
+            group_values = (group_values,)
+        group_name = "_".join([f"{col}_{val}" for col, val in zip(group_cols[:-1], group_values)]) or "all"
+
+        fig, axes = new_figure((20, 7 * len(configs)), len(configs), 1, style=STYLE, squeeze=False)
+        for ax, config in zip(axes[:, 0], configs):
+            y_col = config["y"]
+            metric_df = bar_frame(group_agg[y_col], bar_agg(config)).reset_index()
+            all_x, all_hue, means, sems = align_group(metric_df, x_col, hue_col)
+            x = draw_grouped_bars(ax, all_x, all_hue, means, sems)
+
+            ax.set_ylabel(y_col, fontsize=16)
+            ax.set_xlabel(x_col, fontsize=16)
+            ax.set_title(config['title'], fontsize=18)
+            ax.set_xticks(x)
+            ax.set_xticklabels(all_x, rotation=45, ha='right', fontsize=14)
+            ax.tick_params(axis='y', labelsize=14)
+            if 'Memory' in y_col or 'Runtime' in y_col:
+                ax.yaxis.set_major_formatter(FuncFormatter(format_y_axis))
+
+        axes[0, 0].legend(title=hue_col, bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=14, title_fontsize=16)
+        fig.suptitle(f"Dashboard - {group_name}", fontsize=20)
+        fig.tight_layout()
+        save_figure(fig, os.path.join(outputdir, f"Dashboard_{name}_{group_name}.svg"), dpi=300, bbox_inches='tight')
+
+def out_of_core_tasks(input_pattern, group, outputdir, memory_cap):
+    # Stream one run directory at a time in chunks sized from the memory cap and
+    # fold every chunk into one partial aggregate per bar config, so no run is
+    # held in memory. Filters apply to every chunk; preprocessing cannot
+    aggregates = {}
+    for index, config in enumerate(group["configs"]):
+        if config["type"] != "bar":
+            print(f"{config['title']}: only bar plots can be aggregated out of core, skipped")
+            continue
+        steps = step_names(config.get("preprocess"))
+        if steps:
+            print(f"{config['title']}: {', '.join(steps)} need every iteration of a group and are ignored out of core")
+        keys = config["groupby"] + [config["x"]]
+        aggregates[index] = PartialAggregate(keys, config["y"], DEFAULT_QUANTILES)
+
+    chunk_size = chunk_rows(memory_cap, len(group["columns"]))
+    for chunk in stream_folders(input_pattern, columns=group["columns"], filters=group["filters"],
+                                model=group["model"], chunk_size=chunk_size):
+        for aggregate in aggregates.values():
+            aggregate.fold(chunk)
+    check_memory(memory_cap, chunk_size)
+
+    tasks = []
+    for index, aggregate in aggregates.items():
+        config = group["configs"][index]
+        # The median comes from the t-digest of the partial aggregate
+        result = aggregate.result(config["y"]).rename(columns={"q50": "median"})
+        df_agg = bar_frame(result, bar_agg(config)).reset_index()
+        if df_agg.empty:
+            print(f"No data found for {config['title']}")
+            continue
+        tasks.append(partial(write_and_plot, df_agg, config["groupby"], config["y"], config["x"], outputdir, config))
+    return tasks
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Generate unified plots from multiple CSV files")
     parser.add_argument("input_pattern", help="Glob pattern for directories containing CSV files (e.g., 'path/to/*')")
+    parser.add_argument("--spec", help="TOML/YAML plot spec to use instead of the built-in plot_configs")
+    parser.add_argument("--dashboard", action="store_true", help="Draw bar metrics sharing the same grouping as subplots of one figure per group")
+    parser.add_argument("--workers", type=int, help="Number of plots rendered at once (default: thread pool size)")
+    parser.add_argument("--out-of-core", action="store_true", help="Stream run directories in chunks into mergeable aggregates instead of loading them (bar plots only)")
+    parser.add_argument("--memory-cap", type=float, default=DEFAULT_MEMORY_CAP_MB, help=f"Memory in MB one streamed chunk may use with --out-of-core; it sizes the chunks, the aggregates and run index come on top and a peak above it is reported (default {DEFAULT_MEMORY_CAP_MB})")
+    parser.add_argument("--baseline", help="Branch to normalize bar plots to in configs without a 'baseline' key; also renders the normalized figures")
+    parser.add_argument("--database", help="Results root holding the archive database that configs with an 'sql' key query (default: parent of the output directory)")
+    parser.add_argument("--engine", choices=ENGINES, help="Database engine for 'sql' configs (default: duckdb if installed, else sqlite)")
+    parser.add_argument("--svg", choices=SVG_PROFILES, default="default", help="SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)")
     return parser.parse_args()
 
 def main():
     args = parse_arguments()
+    set_svg_profile(args.svg)
     
     # Get the parent directory of the input pattern
     parent_dir = os.path.dirname(args.input_pattern)
@@ -192,21 +351,41 @@ def main():
     # Set the output directory to be the parent directory
     output_dir = parent_dir
     os.makedirs(output_dir, exist_ok=True)
-    dataframes = pd.DataFrame()
-    for input_dir in glob.glob(args.input_pattern):
-        if os.path.isdir(input_dir):
-            folder_name = os.path.basename(input_dir)
-            csv_file = next((f for f in os.listdir(input_dir) if f.endswith('.csv')), None)
-            if csv_file:
-                df = pd.read_csv(os.path.join(input_dir, csv_file))
-                float_columns = df.select_dtypes(include=['float']).columns
-                for col in float_columns:
-                    df[col] = df[col].astype('float64')
-                df['Folder'] = folder_name  # Add a column to identify the folder
-                dataframes = pd.concat([dataframes, df], ignore_index=True)
-
-    for config in plot_configs:
-        plothandler(dataframes, config, output_dir)
+    configs = load_spec(args.spec) if args.spec else plot_configs
+    if args.baseline:
+        configs = [{"baseline": args.baseline, **config} for config in configs]
+    # An unsupported aggregation fails before any data is read
+    for config in configs:
+        if config.get("type") == "bar":
+            bar_agg(config)
+
+    # Configs with an 'sql' key read their rows from the archive database; the
+    # rest get one projected read per filter group, covering every config in the group;
+    # the plots of all groups are then rendered on a thread pool sharing the frames
+    tasks = []
+    for config in configs:
+        if "sql" not in config:
+            continue
+        df = sql_frame(args.database or os.path.dirname(output_dir), config["sql"], args.engine)
+        if df.empty:
+            print(f"No data found for {config['title']}")
+            continue
+        tasks.append(partial(plothandler, df, config, output_dir))
+    for group in group_configs([config for config in configs if "sql" not in config]):
+        if args.out_of_core:
+            tasks.extend(out_of_core_tasks(args.input_pattern, group, output_dir, args.memory_cap))
+            continue
+        dataframes = load_folders(args.input_pattern, columns=group["columns"],
+                                  filters=group["filters"], model=group["model"])
+        if not dataframes:
+            print(f"No data found for {', '.join(config['title'] for config in group['configs'])}")
+            continue
+        df = pd.concat(dataframes.values(), ignore_index=True)
+        if args.dashboard:
+            tasks.extend(dashboard_tasks(df, group, output_dir))
+            continue
+        tasks.extend(partial(plothandler, df, config, output_dir) for config in group["configs"])
+    render_all(tasks, args.workers)
     
     print(f"All unified plots have been generated and saved in the '{output_dir}' directory.")
 
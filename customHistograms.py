@@ -1,31 +1,41 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import argparse
-import glob
 import numpy as np
-import re
+from plotspec import load_spec, config_columns
+from aggregates import DEFAULT_MEMORY_CAP_MB, PartialAggregate, chunk_rows, check_memory
+from dataloader import RunIndex, load_archive, stream_archive
+from topk import top_k
+from preprocess import preprocess, step_names
+from render import SVG_PROFILES, new_figure, save_figure, set_svg_profile
+
+# Number of branches shown per histogram and the column of the averaged data
+# they are ranked by; configs may override both with "top_n" and "rank_by"
+TOP_N = 15
+RANK_BY = 'mean'
 
 configs = [
     {
-        "modal": "traffic",
+        "model": "traffic",
         "y": "Simulation_Runtime_(secs.)",
+        "filters": ["Simulation_Runtime_(secs.) >= 5"],
         "title": "TrafficPerformers"
     },
     {
-        "modal": "pcs",
+        "model": "pcs",
         "y": "Simulation_Runtime_(secs.)",
+        "filters": ["Simulation_Runtime_(secs.) >= 5"],
         "title": "PCSPerformers"
     },
     {
-        "modal": "epidemic-10k",
+        "model": "epidemic-10k",
         "y": "Simulation_Runtime_(secs.)",
+        "filters": ["Simulation_Runtime_(secs.) >= 5"],
         "title": "EpidemicPerformers"
     },
     {
-        "modal": "epidemic-100k",
+        "model": "epidemic-100k",
         "y": "Simulation_Runtime_(secs.)",
+        "filters": ["Simulation_Runtime_(secs.) >= 5"],
         "title": "Epidemic100kPerformers"
     }
 ]
@@ -35,49 +45,13 @@ def create_output_directory(root_dir):
     os.makedirs(output_dir, exist_ok=True)
     return output_dir
 
-def remove_timestamp(path):
-    return re.sub(r'_\d{14}$', '', path)
-
-def process_csvs(root_dir, keywords):
-    data_frames = []
-
-    if isinstance(keywords, str):
-        keywords = [keywords]
-    
-    keywords = [k.lower() for k in keywords]
-
-    for run_type in os.listdir(root_dir):
-        run_type_path = os.path.join(root_dir, run_type)
-        if os.path.isdir(run_type_path):
-            for model in os.listdir(run_type_path):
-                if all(keyword in model.lower() for keyword in keywords):
-                    model_path = os.path.join(run_type_path, model)
-                    csv_files = glob.glob(os.path.join(model_path, '*.csv'))
-                    
-                    for csv_file in csv_files:
-                        try:
-                            df = pd.read_csv(csv_file)
-                            df['path'] = remove_timestamp(run_type)
-                            data_frames.append(df)
-                        except Exception as e:
-                            print(f"Error reading CSV file {csv_file}: {str(e)}")
-
-    if data_frames:
-        final_df = pd.concat(data_frames, ignore_index=True)
-        print(f"Processed {len(data_frames)} CSV files. Final dataframe shape: {final_df.shape}")
-        return final_df
-    else:
-        print("No data frames were created. Check if the CSV files are in the expected locations.")
-        return None
+def process_csvs(root_dir, keywords, columns=None, filters=None, latest=False):
+    return load_archive(root_dir, keywords, columns, filters, latest=latest)
 
 def calculate_average_config(data, config):
     print(f"Initial data shape: {data.shape}")
     print(f"Columns: {data.columns}")
 
-    # Filter out values smaller than 5 seconds
-    data = data[data[config["y"]] >= 5]
-    print(f"Data shape after filtering: {data.shape}")
-
     # Keep only numeric columns and the 'path' and 'branch' columns
     numeric_columns = data.select_dtypes(include=[np.number]).columns.tolist()
     if 'path' not in numeric_columns:
@@ -90,88 +64,136 @@ def calculate_average_config(data, config):
     # Group by 'path' and 'branch', aggregate the config["y"] column
     grouped_data = data.groupby(["path", "branch"])[config["y"]]
     data = grouped_data.agg(['mean', 'std', 'count']).reset_index()
-    data['sem'] = data['std'] / np.sqrt(data['count'])  # Calculate standard error of the mean
     print(f"Data shape after grouping: {data.shape}")
 
+    avg_data = average_across_paths(data)
+    print(f"Final averaged data shape: {avg_data.shape}")
+    print(f"Final averaged data:\n{avg_data}")
+    return avg_data
+
+def average_across_paths(data):
+    data['sem'] = data['std'] / np.sqrt(data['count'])  # Calculate standard error of the mean
+
     # Calculate the average across configurations
     avg_data = data.groupby('branch').agg({
         'mean': 'mean',
         'sem': lambda x: np.sqrt(np.sum(x**2)) / len(x)  # Propagate error
     }).reset_index()
-
-    avg_data = avg_data.sort_values(by='mean', ascending=True)
-    print(f"Final averaged data shape: {avg_data.shape}")
-    print(f"Final averaged data:\n{avg_data}")
     return avg_data
 
+def stream_average_config(root_dir, config, columns, top_n, rank_by, ascending=True, latest=False,
+                          memory_cap=DEFAULT_MEMORY_CAP_MB):
+    # Stream the archive in chunks sized from the memory cap and fold them into
+    # per (path, branch) count, mean and M2, then keep the top_n branch
+    # averages. Filters apply while reading; preprocessing cannot
+    steps = step_names(config.get("preprocess"))
+    if steps:
+        print(f"{config['title']}: {', '.join(steps)} need every iteration of a group and are ignored with --stream")
+    aggregate = PartialAggregate(["path", "branch"], config["y"])
+    index = RunIndex(root_dir)
+    chunk_size = chunk_rows(memory_cap, len(columns))
+    for chunk in stream_archive(root_dir, config["model"], columns, config.get("filters"), chunk_size, latest, index):
+        aggregate.fold(chunk)
+    index.save()
+    check_memory(memory_cap, chunk_size)
+
+    if aggregate.stats is None:
+        return None
+
+    # A branch's average is only known once every chunk has been folded, so
+    # the ranking is one selection over the (small) per-branch table
+    avg_data = average_across_paths(aggregate.result(config["y"]).reset_index())
+    return top_k(avg_data, top_n, rank_by, ascending)
+
 def data_maker(data, config, output_dir):
     if config["y"] not in data.columns:
         print(f"Column '{config['y']}' not found in the data. Available columns are: {data.columns.tolist()}")
         return
 
+    data = preprocess(data, ["path", "branch"], config["y"], config.get("preprocess"), config["title"])
     avg_data = calculate_average_config(data, config)
 
     if avg_data.empty:
-        print(f"No data left after filtering out values < 5 seconds for {config['modal']}")
+        print(f"No data left after filtering for {config['model']}")
         return
 
     plot_hist(avg_data, config, output_dir, " (Average)")
 
 def plot_hist(data, config, output_dir, title_suffix=""):
-    sorted_data = data.sort_values(by='mean').head(15)
+    sorted_data = top_k(data, config.get("top_n", TOP_N), config.get("rank_by", RANK_BY), config.get("ascending", True))
 
-    plt.figure(figsize=(15, 8))
-    
-    # Use a basic style and manually set properties
-    plt.style.use('default')
-    plt.rcParams['axes.facecolor'] = 'white'
-    plt.rcParams['axes.edgecolor'] = 'lightgray'
-    plt.rcParams['axes.grid'] = True
-    plt.rcParams['grid.alpha'] = 0.3
-    plt.rcParams['grid.color'] = 'lightgray'
+    # White axes with a faint grid, set on this figure only
+    fig, ax = new_figure((15, 8), style='paper')
     
     # Use a single color suitable for research papers
     bar_color = '#4472C4'  # A professional blue color
 
-    bars = plt.bar(range(len(sorted_data)), sorted_data['mean'], align='center', 
+    bars = ax.bar(range(len(sorted_data)), sorted_data['mean'], align='center', 
                    yerr=sorted_data['sem'], capsize=5, 
                    error_kw=dict(ecolor='#2F528F', lw=1, capthick=1, capsize=5),
                    color=bar_color)
 
-    plt.title(f'Histogram of Average {config["y"]} across Branches{title_suffix} on {config["modal"]}',
+    ax.set_title(f'Histogram of Average {config["y"]} across Branches{title_suffix} on {config["model"]}',
               fontsize=14, fontweight='bold')
-    plt.xlabel("Branch", fontsize=12)
-    plt.ylabel(config["y"], fontsize=12)
+    ax.set_xlabel("Branch", fontsize=12)
+    ax.set_ylabel(config["y"], fontsize=12)
 
-    plt.xticks(range(len(sorted_data)), sorted_data['branch'], rotation=45, ha='right', fontsize=10)
-    plt.yticks(fontsize=10)
+    ax.set_xticks(range(len(sorted_data)))
+    ax.set_xticklabels(sorted_data['branch'], rotation=45, ha='right', fontsize=10)
+    ax.tick_params(axis='y', labelsize=10)
 
     # Add value labels on top of each bar
     for i, v in enumerate(sorted_data['mean']):
-        plt.text(i, v, f'{v:.2f}', ha='center', va='bottom', fontsize=9, fontweight='bold', color='#2F528F')
+        ax.text(i, v, f'{v:.2f}', ha='center', va='bottom', fontsize=9, fontweight='bold', color='#2F528F')
 
-    plt.tight_layout()
+    fig.tight_layout()
     filename = f"{config['title']}{title_suffix.replace(' ', '_')}.svg"
     filepath = os.path.join(output_dir, filename)
-    plt.savefig(filepath, bbox_inches='tight', dpi=300)
+    filepath = save_figure(fig, filepath, bbox_inches='tight', dpi=300)
     print(f"Saved plot to {filepath}")
-    plt.close()
     
 def main():
     parser = argparse.ArgumentParser(description='Generate histogram from CSV files in directories.')
     parser.add_argument('directory', type=str, help='Root directory to search for CSV files')
+    parser.add_argument('--spec', type=str, help='TOML/YAML plot spec to use instead of the built-in configs')
+    parser.add_argument('--top-n', type=int, help=f'Number of branches per histogram (default {TOP_N})')
+    parser.add_argument('--rank-by', type=str, choices=['mean', 'sem'], help=f'Averaged column branches are ranked by (default {RANK_BY})')
+    parser.add_argument('--stream', action='store_true', help='Rank while ingesting one CSV at a time instead of loading every run')
+    parser.add_argument('--memory-cap', type=float, default=DEFAULT_MEMORY_CAP_MB, help=f'Memory in MB one streamed chunk may use with --stream; it sizes the chunks, the aggregates and run index come on top and a peak above it is reported (default {DEFAULT_MEMORY_CAP_MB})')
+    parser.add_argument('--latest', action='store_true', help='Only read the newest run directory of every run type')
+    parser.add_argument('--svg', choices=SVG_PROFILES, default='default', help='SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)')
     args = parser.parse_args()
+    set_svg_profile(args.svg)
     output_dir = create_output_directory(args.directory)
 
-    for config in configs:
+    for config in (load_spec(args.spec) if args.spec else configs):
+        config = dict(config)
+        if args.top_n:
+            config["top_n"] = args.top_n
+        if args.rank_by:
+            config["rank_by"] = args.rank_by
         print(f"\nProcessing config: {config}")
-        dataframe = process_csvs(args.directory, config["modal"])
+        # Filters are applied while reading, so short runs never reach the
+        # averaging step; preprocessing (outliers) runs on the loaded rows and
+        # reports what it dropped
+        columns = config_columns(config) | {'branch'}
+
+        if args.stream:
+            top_data = stream_average_config(args.directory, config, columns, config.get("top_n", TOP_N),
+                                             config.get("rank_by", RANK_BY), config.get("ascending", True), args.latest, args.memory_cap)
+            if top_data is None or top_data.empty:
+                print(f"No data found for {config['model']}")
+                continue
+            plot_hist(top_data, config, output_dir, " (Average)")
+            continue
+
+        dataframe = process_csvs(args.directory, config["model"], columns, config.get("filters"), args.latest)
         
         if dataframe is None:
-            print(f"No data found for {config['modal']}")
+            print(f"No data found for {config['model']}")
             continue
         
-        print(f"Columns for {config['modal']}:")
+        print(f"Columns for {config['model']}:")
         print(dataframe.columns)
         
         data_maker(dataframe, config, output_dir)
@@ -1,17 +1,16 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import argparse
+from functools import partial
 from matplotlib.ticker import FuncFormatter
-import glob
+from plotspec import load_spec, group_configs
+from dataloader import load_folders
+from decimate import LOD_METHODS, decimate_frame, rasterize_data_artists
+from preprocess import preprocess
+from render import SVG_PROFILES, new_figure, render_all, save_figure, set_svg_profile
 
-# Use a basic style that should be available in all matplotlib installations
-plt.style.use('default')
-
-# Set seaborn style manually
-sns.set_style("whitegrid")
-sns.set_palette("deep")
+# Every figure is drawn with seaborn's "whitegrid" look and "deep" palette
+STYLE = "whitegrid"
 
 colors = ["#ff9999", "#66b3ff", "#99ff99", "#ffcc99", "#ff99cc", "#99ffff", "#ff99ff", "#ffff99"]
 
@@ -58,14 +57,14 @@ plot_configs = [
     }
 ]
 
-def create_unified_plot(dataframes, config, output_dir):
-    plt.figure(figsize=(16, 10))
-    ax = plt.gca()
+def create_unified_plot(dataframes, config, output_dir, max_points=None, lod='lttb', rasterize=False):
+    fig, ax = new_figure((16, 10), style=STYLE)
 
     all_handles = []
     all_labels = []
 
     for i, (model, df) in enumerate(dataframes.items()):
+        df = preprocess(df, [config['groupby'], config['x']], config['y'], config.get('preprocess'), f"{config['title']} - {model}")
         grouped_data = df.groupby([config['groupby'], config['x']])[config['y']].agg(config['agg']).reset_index()
         
         if config['type'] == 'bar':
@@ -78,6 +77,8 @@ def create_unified_plot(dataframes, config, output_dir):
             ax.legend().remove()  # Remove the current legend to avoid duplicates
         
         elif config['type'] == 'line':
+            grouped_data = decimate_frame(grouped_data, config['x'], config['y'], by=config['groupby'],
+                                          max_points=max_points, method=lod)
             sns.lineplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, 
                          marker='o', palette=colors[i*2:(i+1)*2], ax=ax)
             handles, labels = ax.get_legend_handles_labels()
@@ -86,33 +87,44 @@ def create_unified_plot(dataframes, config, output_dir):
             all_labels.extend(new_labels[len(all_labels):])  # Add only new labels
             ax.legend().remove()  # Remove the current legend to avoid duplicates
 
-    plt.title(config['title'], fontsize=20, fontweight='bold', pad=20)
-    plt.xlabel(config['x'], fontsize=14, labelpad=10)
-    plt.ylabel(config['y'], fontsize=14, labelpad=10)
+    if rasterize and config['type'] == 'line':
+        rasterize_data_artists(ax)
+
+    ax.set_title(config['title'], fontsize=20, fontweight='bold', pad=20)
+    ax.set_xlabel(config['x'], fontsize=14, labelpad=10)
+    ax.set_ylabel(config['y'], fontsize=14, labelpad=10)
     
     ax.yaxis.set_major_formatter(FuncFormatter(format_y_axis))
     
     if len(grouped_data[config['x']].unique()) > 10:
-        plt.xticks(rotation=45, ha='right')
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
 
     ax.legend(all_handles, all_labels, title='Model - ' + config['groupby'], 
               title_fontsize='13', fontsize='11', bbox_to_anchor=(1.05, 1), loc='upper left')
 
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.tight_layout()
+    ax.grid(True, linestyle='--', alpha=0.7)
+    fig.tight_layout()
     
     filename = f"Unified_{config['title'].replace(' ', '_')}.svg"
-    plt.savefig(os.path.join(output_dir, filename), dpi=300, bbox_inches='tight')
-    plt.close()
+    save_figure(fig, os.path.join(output_dir, filename), dpi=300, bbox_inches='tight')
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Generate unified plots from multiple CSV files")
     parser.add_argument("input_pattern", help="Glob pattern for directories containing CSV files (e.g., 'path/to/*')")
+    parser.add_argument("--spec", help="TOML/YAML plot spec to use instead of the built-in plot_configs")
+    parser.add_argument("--max-points", type=int, help="Decimate every line of a line plot to at most this many points")
+    parser.add_argument("--lod", choices=LOD_METHODS, default="lttb", help="Decimation method used with --max-points")
+    parser.add_argument("--rasterize", action="store_true", help="Rasterize line plot data while keeping axes and text as vectors")
+    parser.add_argument("--workers", type=int, help="Number of plots rendered at once (default: thread pool size)")
+    parser.add_argument("--svg", choices=SVG_PROFILES, default="default", help="SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)")
     return parser.parse_args()
 
 def main():
     args = parse_arguments()
+    set_svg_profile(args.svg)
     
     # Get the parent directory of the input pattern
     parent_dir = os.path.dirname(args.input_pattern)
@@ -121,18 +133,20 @@ def main():
     output_dir = parent_dir
     os.makedirs(output_dir, exist_ok=True)
     
-    dataframes = {}
-    for input_dir in glob.glob(args.input_pattern):
-        if os.path.isdir(input_dir):
-            folder_name = os.path.basename(input_dir)
-            csv_file = next((f for f in os.listdir(input_dir) if f.endswith('.csv')), None)
-            if csv_file:
-                df = pd.read_csv(os.path.join(input_dir, csv_file))
-                df['Folder'] = folder_name  # Add a column to identify the folder
-                dataframes[folder_name] = df
-    
-    for config in plot_configs:
-        create_unified_plot(dataframes, config, output_dir)
+    configs = load_spec(args.spec) if args.spec else plot_configs
+
+    # One projected read per filter group, covering every config in the group;
+    # the plots of all groups are then rendered on a thread pool sharing the frames
+    tasks = []
+    for group in group_configs(configs):
+        dataframes = load_folders(args.input_pattern, columns=group['columns'],
+                                  filters=group['filters'], model=group['model'])
+        if not dataframes:
+            print(f"No data found for {', '.join(config['title'] for config in group['configs'])}")
+            continue
+        tasks.extend(partial(create_unified_plot, dataframes, config, output_dir, args.max_points, args.lod, args.rasterize)
+                     for config in group['configs'])
+    render_all(tasks, args.workers)
     
     print(f"All unified plots have been generated and saved in the '{output_dir}' directory.")
 
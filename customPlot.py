@@ -1,9 +1,17 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import argparse
-import glob
+from functools import partial
+from plotspec import load_spec, group_configs
+from dataloader import match_model, read_results, result_files
+from decimate import LOD_METHODS, decimate_frame, rasterize_data_artists
+from preprocess import preprocess
+from render import new_figure, render_all
+
+# Unlike customOverallplot this script never set a seaborn style, so figures keep
+# matplotlib's default look
+STYLE = None
 
 # List of plot configurations
 plot_configs = [
@@ -42,7 +50,9 @@ plot_configs = [
     # Add more configurations as needed
 ]
 
-def create_plot(df, config, output_dir):
+def create_plot(df, config, output_dir, max_points=None, lod='lttb', rasterize=False):
+    df = preprocess(df, [config['groupby'], config['x']], config['y'], config.get('preprocess'), config['title'])
+
     # Group and aggregate data
     if isinstance(config['y'], list):
         grouped_data = df.groupby([config['groupby'], config['x']])[config['y']].agg(config['agg']).reset_index()
@@ -50,36 +60,41 @@ def create_plot(df, config, output_dir):
         grouped_data = df.groupby([config['groupby'], config['x']])[config['y']].agg(config['agg']).reset_index()
     
     # Create plot
-    plt.figure(figsize=(12, 6))
+    fig, ax = new_figure((12, 6), style=STYLE)
     if config['type'] == 'bar':
         if isinstance(config['y'], list):
             grouped_data_melted = pd.melt(grouped_data, id_vars=[config['groupby'], config['x']], value_vars=config['y'])
-            sns.barplot(x=config['x'], y='value', hue=config['groupby'], data=grouped_data_melted, dodge=True, errorbar=None)
+            sns.barplot(x=config['x'], y='value', hue=config['groupby'], data=grouped_data_melted, dodge=True, errorbar=None, ax=ax)
         else:
-            sns.barplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, errorbar=None)
+            sns.barplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, errorbar=None, ax=ax)
     elif config['type'] == 'line':
-        if isinstance(config['y'], list):
-            for y in config['y']:
-                sns.lineplot(x=config['x'], y=y, hue=config['groupby'], data=grouped_data, marker='o')
-        else:
-            sns.lineplot(x=config['x'], y=config['y'], hue=config['groupby'], data=grouped_data, marker='o')
+        # Each line is decimated to at most max_points before drawing
+        for y in (config['y'] if isinstance(config['y'], list) else [config['y']]):
+            line_data = decimate_frame(grouped_data, config['x'], y, by=config['groupby'], max_points=max_points, method=lod)
+            sns.lineplot(x=config['x'], y=y, hue=config['groupby'], data=line_data, marker='o', ax=ax)
+        if rasterize:
+            rasterize_data_artists(ax)
     
-    plt.title(config['title'])
-    plt.xlabel(config['x'])
-    plt.ylabel(config['y'] if isinstance(config['y'], str) else ', '.join(config['y']))
-    plt.legend(title=config['groupby'])
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    ax.set_title(config['title'])
+    ax.set_xlabel(config['x'])
+    ax.set_ylabel(config['y'] if isinstance(config['y'], str) else ', '.join(config['y']))
+    ax.legend(title=config['groupby'])
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
     
     # Save the plot
     filename = f"{config['title'].replace(' ', '_')}.png"
-    plt.savefig(os.path.join(output_dir, filename))
-    plt.close()
+    fig.savefig(os.path.join(output_dir, filename))
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Generate plots from CSV data in a folder")
     parser.add_argument("input_folder", help="Path to the input folder containing CSV files")
+    parser.add_argument("--spec", help="TOML/YAML plot spec to use instead of the built-in plot_configs")
+    parser.add_argument("--max-points", type=int, help="Decimate every line of a line plot to at most this many points")
+    parser.add_argument("--lod", choices=LOD_METHODS, default="lttb", help="Decimation method used with --max-points")
+    parser.add_argument("--rasterize", action="store_true", help="Rasterize line plot data while keeping axes and text as vectors")
+    parser.add_argument("--workers", type=int, help="Number of plots rendered at once (default: thread pool size)")
     return parser.parse_args()
 
 def main():
@@ -90,19 +105,29 @@ def main():
     output_dir = os.path.join(args.input_folder, 'output_plots')
     os.makedirs(output_dir, exist_ok=True)
     
-    # Look for all CSV files in the specified folder
-    csv_files = glob.glob(os.path.join(args.input_folder, '*.csv'))
+    # Look for all result files (plain or compressed CSV) in the specified folder
+    csv_files = result_files(args.input_folder)
     
     if not csv_files:
         print(f"No CSV files found in the directory '{args.input_folder}'")
         return
     
-    # Create plots for each CSV file found
+    configs = load_spec(args.spec) if args.spec else plot_configs
+    folder_name = os.path.basename(os.path.normpath(args.input_folder))
+
+    groups = [group for group in group_configs(configs) if match_model(folder_name, group['model'])]
+
+    # Create plots for each CSV file found; the plots are rendered on a thread
+    # pool sharing the loaded frames
+    tasks = []
     for csv_file in csv_files:
-        df = pd.read_csv(csv_file)
         print(f"Processing {csv_file}")
-        for config in plot_configs:
-            create_plot(df, config, output_dir)
+        for group in groups:
+            # One projected read per filter group, covering every config in the group
+            df = read_results(csv_file, columns=group['columns'], filters=group['filters'])
+            tasks.extend(partial(create_plot, df, config, output_dir, args.max_points, args.lod, args.rasterize)
+                         for config in group['configs'])
+    render_all(tasks, args.workers)
     
     print(f"All plots have been generated and saved in the '{output_dir}' directory.")
 
@@ -0,0 +1,432 @@
+import bz2
+import glob
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from derived import (DERIVED_COLUMNS, SEQUENTIAL_FILE, SEQUENTIAL_RUNTIME, add_derived, base_columns, dataset_version,
+                     read_sequential)
+from plotspec import apply_filters, filter_columns
+from rundirs import add_run_columns, latest_run_dirs, remove_timestamp
+
+# Rows parsed per chunk; filters run on each chunk so rows that a plot does not
+# need are dropped before the chunks are concatenated
+CHUNK_SIZE = 100000
+
+# Fixed parse types for the scheduleq columns listed in `variables`, so the
+# parser never has to infer them and every file yields the same dtypes
+TEXT_COLUMNS = ['branch', 'Model', 'Model_Command', 'Schedule_Queue_Type', 'is_LP_Migration_ON', 'GVT_Method']
+FLOAT_COLUMNS = ['Simulation_Runtime_(secs.)', 'Average_Memory_Usage_(MB)']
+INT_COLUMNS = [
+    'Max_Simulation_Time', 'Worker_Thread_Count', 'Schedule_Queue_Count', 'State_Save_Period',
+    'Number_of_Objects', 'Local_Positive_Events_Sent', 'Remote_Positive_Events_Sent',
+    'Local_Negative_Events_Sent', 'Remote_Negative_Events_Sent', 'Primary_Rollbacks',
+    'Secondary_Rollbacks', 'Coast_Forwarded_Events', 'Cancelled_Events', 'Events_Processed',
+    'Events_Committed', 'Events_for_Starved_Objects', 'Sched_Event_Swaps_Success',
+    'Sched_Event_Swaps_Failed',
+]
+COLUMN_DTYPES = {
+    **{col: 'object' for col in TEXT_COLUMNS},
+    **{col: 'float64' for col in FLOAT_COLUMNS},
+    **{col: 'int64' for col in INT_COLUMNS},
+}
+# Counter columns read as float64, for files where they have missing values
+RELAXED_DTYPES = {col: ('float64' if dtype == 'int64' else dtype) for col, dtype in COLUMN_DTYPES.items()}
+
+
+def match_model(name, keywords):
+    if not keywords:
+        return True
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    return all(keyword.lower() in name.lower() for keyword in keywords)
+
+
+# Result files may be kept compressed; pandas picks the codec from the
+# extension (.csv.zst needs the zstandard package)
+RESULT_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.csv.zst')
+# Files read at once by load_archive/load_folders. Decompression and parsing
+# release the GIL, so threads overlap them
+READ_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def is_result_file(name):
+    return name.endswith(RESULT_EXTENSIONS) and not os.path.basename(name).startswith('.')
+
+
+def result_files(directory):
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if is_result_file(f)]
+
+
+def find_csv(input_dir):
+    return next((os.path.basename(f) for f in result_files(input_dir)), None)
+
+
+def find_result(directory, stem):
+    # <directory>/<stem>.csv or one of its compressed variants
+    return next((os.path.join(directory, stem + ext) for ext in RESULT_EXTENSIONS
+                 if os.path.exists(os.path.join(directory, stem + ext))), None)
+
+
+def read_parallel(read, items, workers=None):
+    # read(item) for every item on a thread pool, results in the order of items
+    items = list(items)
+    workers = workers or READ_WORKERS
+    if workers == 1 or len(items) < 2:
+        return [read(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(read, items))
+
+
+# Run-identity index of every archive root: one hash per CSV row together with
+# the size and mtime of the file it was computed from. It is kept in a per-user
+# cache directory (PLOTTHESIS_CACHE, default ~/.cache/plotthesis) rather than
+# in the archive, so read-only and shared archives work as well
+CACHE_DIR = os.environ.get('PLOTTHESIS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'plotthesis'))
+RUN_INDEX = 'run_index.csv'
+# Parsed rows of every (result file, projection) read by load_archive
+FRAME_CACHE = 'frames'
+ROW_COLUMN = 'Row'
+DECOMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# A line with an odd number of quotes continues in the next line
+OPEN_QUOTE = re.compile(rb'^[^"\n]*(?:"[^"\n]*"[^"\n]*)*"[^"\n]*$', re.M)
+
+
+def cache_path(root_dir, name):
+    # Cache file `name` of the archive at root_dir
+    key = hashlib.md5(os.path.abspath(root_dir).encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, key, name)
+
+
+def read_chunks(csv_file, usecols, dtypes, filters, extra, row_ids=False, data=None):
+    # Derived columns used by filters have to exist before the rows are dropped
+    filter_derived = filter_columns(filters) & DERIVED_COLUMNS.keys()
+    chunks = []
+    source = io.BytesIO(data) if data is not None else csv_file
+    for chunk in pd.read_csv(source, usecols=usecols, dtype=dtypes, chunksize=CHUNK_SIZE):
+        if row_ids:
+            # The chunk index counts rows across the whole file
+            chunk[ROW_COLUMN] = chunk.index
+        for name, value in (extra or {}).items():
+            chunk[name] = value
+        add_derived(chunk, filter_derived)
+        chunks.append(apply_filters(chunk, filters))
+    return chunks
+
+
+def projection(csv_file, columns, extra):
+    # usecols callable and constant columns for reading `columns` of csv_file;
+    # the sequential runtime is added when it is wanted and available
+    usecols = None
+    extra = dict(extra or {})
+    if columns is not None:
+        wanted = base_columns(columns)
+        usecols = lambda col: col in wanted
+    if columns is None or SEQUENTIAL_RUNTIME in base_columns(columns):
+        seq_time = read_sequential(os.path.dirname(csv_file))
+        if seq_time is not None:
+            extra[SEQUENTIAL_RUNTIME] = seq_time
+    return usecols, extra
+
+
+def read_results(csv_file, columns=None, filters=None, extra=None, row_ids=False, data=None):
+    # `columns` is pushed into the parser as usecols, `filters` is applied to
+    # every chunk and `extra` adds constant columns (Folder, path, ...) before
+    # filtering so filters may reference them as well. Derived columns among
+    # `columns` are computed from their inputs once the file has been read.
+    # `row_ids` keeps the row number within the file in a 'Row' column.
+    # `data` holds the decompressed content of csv_file when already read
+    usecols, extra = projection(csv_file, columns, extra)
+    try:
+        chunks = read_chunks(csv_file, usecols, COLUMN_DTYPES, filters, extra, row_ids, data)
+    except ValueError:
+        # A counter column with missing values cannot be parsed as int64
+        chunks = read_chunks(csv_file, usecols, RELAXED_DTYPES, filters, extra, row_ids, data)
+
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks, ignore_index=True)
+    df.attrs['version'] = dataset_version([csv_file], columns, filters)
+    return add_derived(df, columns if columns is not None else [])
+
+
+def stream_results(csv_file, columns=None, filters=None, extra=None, chunk_size=CHUNK_SIZE, row_ids=False):
+    # Out-of-core counterpart of read_results: yields the filtered chunks of
+    # csv_file with their derived columns and never holds more than one chunk.
+    # Counter columns are read as float64 so a missing value late in the file
+    # cannot fail a stream that has been partly consumed
+    usecols, extra = projection(csv_file, columns, extra)
+    filter_derived = filter_columns(filters) & DERIVED_COLUMNS.keys()
+    wanted_derived = set(columns if columns is not None else []) & DERIVED_COLUMNS.keys()
+    for chunk in pd.read_csv(csv_file, usecols=usecols, dtype=RELAXED_DTYPES, chunksize=chunk_size):
+        # Counters without missing values in this chunk go back to int64, so
+        # group labels match those of read_results
+        complete = [col for col in INT_COLUMNS if col in chunk.columns and chunk[col].notna().all()]
+        if complete:
+            chunk = chunk.astype({col: 'int64' for col in complete})
+        if row_ids:
+            chunk[ROW_COLUMN] = chunk.index
+        for name, value in extra.items():
+            chunk[name] = value
+        add_derived(chunk, filter_derived)
+        chunk = apply_filters(chunk, filters)
+        if wanted_derived - set(chunk.columns):
+            chunk = add_derived(chunk.copy(), wanted_derived)
+        if not chunk.empty:
+            yield chunk
+
+
+def stream_folders(input_pattern, columns=None, filters=None, model=None, chunk_size=CHUNK_SIZE):
+    # Chunks of the result CSV of every directory matching input_pattern, one
+    # directory at a time, with the folder name in 'Folder'
+    for input_dir in sorted(glob.glob(input_pattern)):
+        if os.path.isdir(input_dir) and match_model(os.path.basename(input_dir), model):
+            csv_file = find_csv(input_dir)
+            if csv_file:
+                yield from stream_results(os.path.join(input_dir, csv_file), columns, filters,
+                                          extra={'Folder': os.path.basename(input_dir)}, chunk_size=chunk_size)
+
+
+def load_folders(input_pattern, columns=None, filters=None, model=None, workers=None):
+    # Load one result CSV per directory matching input_pattern, keyed by folder
+    # name; the files are read on a thread pool
+    sources = {}
+    for input_dir in sorted(glob.glob(input_pattern)):
+        if os.path.isdir(input_dir):
+            folder_name = os.path.basename(input_dir)
+            if not match_model(folder_name, model):
+                continue
+            csv_file = find_csv(input_dir)
+            if csv_file:
+                sources[folder_name] = os.path.join(input_dir, csv_file)
+    read = lambda item: read_results(item[1], columns, filters, extra={'Folder': item[0]})
+    return dict(zip(sources, read_parallel(read, sources.items(), workers)))
+
+
+def iter_archive(root_dir, model=None, latest=False):
+    # Yield (run type, model directory, csv file) for every result file
+    # <run type>/<model>/*.csv (or compressed *.csv.gz, ...).
+    # With latest only the newest directory of every run type is visited
+    run_types = sorted(os.listdir(root_dir))
+    if latest:
+        run_types = sorted(latest_run_dirs(run_types))
+    for run_type in run_types:
+        run_type_path = os.path.join(root_dir, run_type)
+        if os.path.isdir(run_type_path):
+            for model_dir in sorted(os.listdir(run_type_path)):
+                if match_model(model_dir, model):
+                    model_path = os.path.join(run_type_path, model_dir)
+                    if os.path.isdir(model_path):
+                        for csv_file in result_files(model_path):
+                            yield run_type, model_dir, csv_file
+
+
+def frame_cache(csv_file, columns, filters, row_ids):
+    # (cache file, version) of the parsed rows of csv_file under one projection.
+    # The file name only depends on the projection, so a changed CSV replaces
+    # its entry; the version also covers the file's size and mtime and those of
+    # the sequential.dat whose runtime is added to its rows
+    sources = [csv_file] + [path for path in [os.path.join(os.path.dirname(csv_file), SEQUENTIAL_FILE)]
+                            if os.path.exists(path)]
+    version = dataset_version(sources, columns, filters) + ('-rows' if row_ids else '')
+    projection_key = repr((os.path.abspath(csv_file), sorted(columns) if columns is not None else None,
+                           repr(filters), row_ids))
+    name = hashlib.md5(projection_key.encode()).hexdigest() + '.pkl'
+    return os.path.join(CACHE_DIR, FRAME_CACHE, name), version
+
+
+def read_archive_file(run_type, model_dir, csv_file, columns=None, filters=None, index=None):
+    # The run type (timestamp removed) goes to 'path', the run directory as is
+    # to 'Run_Dir' and the model directory to 'Folder'. With a RunIndex the rows
+    # are hashed and numbered for index.deduplicate, which depends on the order
+    # files are visited in and so is left to the caller; this part is safe to
+    # run on several files at once. The parsed rows are cached, so a file whose
+    # size and mtime are unchanged since it was last read is neither parsed nor
+    # hashed again
+    try:
+        cache_file, version = frame_cache(csv_file, columns, filters, index is not None)
+        if (index is None or index.is_current(csv_file)) and os.path.exists(cache_file):
+            df = pd.read_pickle(cache_file)
+            if df.attrs.get('cache_version') == version:
+                return df
+
+        data = None
+        if index is not None and not index.is_current(csv_file):
+            # The file is read once for both its hashes and its rows
+            data = read_bytes(csv_file)
+            index.hashes(csv_file, data)
+        df = read_results(csv_file, columns, filters, row_ids=index is not None, data=data,
+                          extra={'path': remove_timestamp(run_type), 'Run_Dir': run_type, 'Folder': model_dir})
+        df.attrs['cache_version'] = version
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        df.to_pickle(tmp_file)
+        os.replace(tmp_file, cache_file)
+        return df
+    except Exception as e:
+        print(f"Error reading CSV file {csv_file}: {str(e)}")
+        return None
+
+
+def read_bytes(csv_file):
+    # Decompressed content of a result file
+    ext = os.path.splitext(csv_file)[1]
+    if ext == '.zst':
+        import zstandard
+        with open(csv_file, 'rb') as f:
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+    with DECOMPRESSORS.get(ext, open)(csv_file, 'rb') as f:
+        return f.read()
+
+
+def row_hashes(csv_file, data=None):
+    # Identity of a run: its line as written, so the same run copied to another
+    # run type or archive hashes the same. Lines are split without parsing the
+    # CSV; only files with quoted line breaks are parsed to find their rows
+    data = read_bytes(csv_file) if data is None else data
+    if OPEN_QUOTE.search(data):
+        chunks = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, chunksize=CHUNK_SIZE)
+        hashes = [pd.util.hash_pandas_object(chunk, index=False).to_numpy() for chunk in chunks]
+        return np.concatenate(hashes) if hashes else np.zeros(0, dtype='uint64')
+    lines = [line for line in data.splitlines()[1:] if line.strip()]
+    return pd.util.hash_array(np.array(lines, dtype=object))
+
+
+class RunIndex:
+    # Row hashes of every ingested CSV, cached per archive root (see
+    # cache_path) so a repeated ingest only hashes files that are new or
+    # changed. A run already ingested from another file is dropped and recorded
+    # in `provenance` as (file, row, duplicate_of_file, duplicate_of_row);
+    # identical rows within one file are repeated iterations and are kept
+
+    def __init__(self, root_dirs):
+        self.root_dirs = [root_dirs] if isinstance(root_dirs, str) else list(root_dirs)
+        self.files = {}
+        self.masks = {}
+        self.provenance = []
+        self.changed = False
+        # First occurrence of every hash seen so far as file number << 32 | row,
+        # so every file costs a lookup per row however many came before it
+        self.first = {}
+        self.file_names = []
+        for root_dir in self.root_dirs:
+            self.files.update(self.read(cache_path(root_dir, RUN_INDEX)))
+
+    @staticmethod
+    def read(index_file):
+        if not os.path.exists(index_file):
+            return {}
+        entries = pd.read_csv(index_file, dtype={'file': str, 'size': 'int64', 'mtime': 'int64',
+                                                 'row': 'int64', 'hash': 'uint64'})
+        return {csv_file: (group['size'].iat[0], group['mtime'].iat[0], group.sort_values('row')['hash'].to_numpy())
+                for csv_file, group in entries.groupby('file', sort=False)}
+
+    def is_current(self, csv_file):
+        stat = os.stat(csv_file)
+        cached = self.files.get(os.path.abspath(csv_file))
+        return cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns
+
+    def hashes(self, csv_file, data=None):
+        # `data` is the decompressed content when the caller has read it already
+        key = os.path.abspath(csv_file)
+        if not self.is_current(csv_file):
+            stat = os.stat(csv_file)
+            self.files[key] = (stat.st_size, stat.st_mtime_ns, row_hashes(csv_file, data))
+            self.changed = True
+        return self.files[key][2]
+
+    def keep_mask(self, csv_file):
+        # Rows of csv_file whose run was not ingested from an earlier file;
+        # computed once per file, so a file may also be deduplicated chunk by chunk
+        if csv_file in self.masks:
+            return self.masks[csv_file]
+        hashes = self.hashes(csv_file).tolist()
+        first = self.first
+        keep = np.fromiter((h not in first for h in hashes), dtype=bool, count=len(hashes))
+        dropped = np.flatnonzero(~keep)
+        if len(dropped):
+            origins = [first[hashes[row]] for row in dropped]
+            first_files = [self.file_names[origin >> 32] for origin in origins]
+            self.provenance.extend(zip([csv_file] * len(dropped), dropped.tolist(), first_files,
+                                       [origin & 0xFFFFFFFF for origin in origins]))
+            print(f"Dropped {len(dropped)} duplicate rows of {csv_file} "
+                  f"(first seen in {', '.join(sorted(set(first_files)))})")
+
+        # Rows repeated within this file keep their first row as origin
+        file_id = len(self.file_names) << 32
+        self.file_names.append(csv_file)
+        for row in np.flatnonzero(keep).tolist():
+            first.setdefault(hashes[row], file_id | row)
+        self.masks[csv_file] = keep
+        return keep
+
+    def deduplicate(self, df, csv_file):
+        keep = self.keep_mask(csv_file)
+        if df.empty:
+            return df
+        return df[keep[df[ROW_COLUMN].to_numpy()]].drop(columns=ROW_COLUMN)
+
+    def save(self):
+        if not self.changed:
+            return
+        for root_dir in self.root_dirs:
+            prefix = os.path.join(os.path.abspath(root_dir), '')
+            entries = [pd.DataFrame({'file': csv_file, 'size': size, 'mtime': mtime,
+                                     'row': np.arange(len(hashes)), 'hash': hashes})
+                       for csv_file, (size, mtime, hashes) in self.files.items() if csv_file.startswith(prefix)]
+            if entries:
+                index_file = cache_path(root_dir, RUN_INDEX)
+                os.makedirs(os.path.dirname(index_file), exist_ok=True)
+                pd.concat(entries, ignore_index=True).to_csv(index_file, index=False)
+        self.changed = False
+
+
+def load_archive(root_dir, model=None, columns=None, filters=None, dedup=True, latest=False, workers=None):
+    # Load every <run type>/<model>/*.csv below root_dir (or a list of roots)
+    # into one frame. With dedup the same run is only counted once, even when
+    # it was copied to another run type or archive; with latest only the newest
+    # run of every type is read. The run directory is parsed into categorical
+    # Run_Type/Location and datetime Timestamp columns. Files are read and
+    # decompressed on a thread pool, then deduplicated in archive order
+    root_dirs = [root_dir] if isinstance(root_dir, str) else list(root_dir)
+    index = RunIndex(root_dirs) if dedup else None
+    sources = [source for root in root_dirs for source in iter_archive(root, model, latest)]
+    read = lambda source: read_archive_file(*source, columns, filters, index)
+    data_frames = []
+    for (_, _, csv_file), df in zip(sources, read_parallel(read, sources, workers)):
+        if df is not None:
+            data_frames.append(index.deduplicate(df, csv_file) if index is not None else df)
+    if index is not None:
+        index.save()
+
+    if data_frames:
+        final_df = add_run_columns(pd.concat(data_frames, ignore_index=True))
+        if index is not None and index.provenance:
+            final_df.attrs['provenance'] = pd.DataFrame(index.provenance, columns=[
+                'file', 'row', 'duplicate_of_file', 'duplicate_of_row'])
+        print(f"Processed {len(data_frames)} CSV files. Final dataframe shape: {final_df.shape}")
+        return final_df
+    else:
+        print("No data frames were created. Check if the CSV files are in the expected locations.")
+        return None
+
+
+def stream_archive(root_dir, model=None, columns=None, filters=None, chunk_size=CHUNK_SIZE, latest=False, index=None):
+    # Chunks of every <run type>/<model>/*.csv below root_dir, one file at a
+    # time, with the same 'path', 'Run_Dir' and 'Folder' columns as
+    # load_archive. With a RunIndex, copies of runs already seen are dropped
+    for run_type, model_dir, csv_file in iter_archive(root_dir, model, latest):
+        extra = {'path': remove_timestamp(run_type), 'Run_Dir': run_type, 'Folder': model_dir}
+        try:
+            for chunk in stream_results(csv_file, columns, filters, extra, chunk_size, row_ids=index is not None):
+                yield index.deduplicate(chunk, csv_file) if index is not None else chunk
+        except Exception as e:
+            print(f"Error reading CSV file {csv_file}: {str(e)}")
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Level-of-detail helpers for line plots. Dense sweeps (thread counts, GVT
+# periods) are reduced to at most `max_points` points per line before drawing,
+# and the data artists can be rasterized so the vector figure keeps only axes,
+# ticks and text as paths.
+
+LOD_METHODS = ['lttb', 'minmax']
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps first and last point and, for every
+    # bucket in between, the point forming the largest triangle with the point
+    # kept before it and the average of the next bucket
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev]) -
+                      (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+
+def minmax(x, y, n_out):
+    # Keeps the minimum and maximum of every bucket, preserving spikes
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    buckets = np.array_split(np.arange(n), max(n_out // 2, 1))
+    selected = set()
+    for bucket in buckets:
+        values = y[bucket]
+        selected.add(bucket[np.argmin(values)])
+        selected.add(bucket[np.argmax(values)])
+    return np.array(sorted(selected))
+
+
+def decimate_indices(x, y, max_points, method='lttb'):
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    if method == 'lttb':
+        return lttb(x, y, max_points)
+    if method == 'minmax':
+        return minmax(x, y, max_points)
+    raise ValueError(f"Unknown decimation method '{method}' (expected one of {LOD_METHODS})")
+
+
+def decimate_frame(df, x_col, y_col, by=None, max_points=None, method='lttb'):
+    # Decimate every line (one per `by` value) of a long-format frame
+    if not max_points or len(df) <= max_points:
+        return df
+
+    groups = df.groupby(by, sort=False) if by else [(None, df)]
+    keep = []
+    for _, group in groups:
+        group = group.sort_values(x_col)
+        x = group[x_col]
+        if not pd.api.types.is_numeric_dtype(x):
+            x = np.arange(len(group))
+        keep.append(group.index.to_numpy()[decimate_indices(x, group[y_col], max_points, method)])
+    return df.loc[np.concatenate(keep)]
+
+
+def rasterize_data_artists(ax):
+    # Lines, markers and error bars become embedded bitmaps while axes, ticks,
+    # labels and legend stay vector
+    for artist in list(ax.lines) + list(ax.collections) + list(ax.patches):
+        artist.set_rasterized(True)
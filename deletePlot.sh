@@ -19,7 +19,7 @@ delete_files() {
     declare -A file_counts
 
     # List of file extensions to delete
-    local extensions=("svg" "txt" "tex" "pdf" "pdf_tex" "toc" "out" "blg" "bbl" "aux")
+    local extensions=("svg" "svgz" "txt" "tex" "pdf" "pdf_tex" "toc" "out" "blg" "bbl" "aux")
     
     # Initialize counters
     for ext in "${extensions[@]}"; do
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Registry of derived metrics that plot configs may use like ordinary columns.
+#
+# Each entry lists the columns it is computed from and a vectorized function of
+# the dataframe. Configs referencing a derived column get its inputs added to
+# the loader's column projection, and the column itself is only computed when
+# requested. The latest results are cached per dataset version, so configs
+# sharing a frame (or an identical reload of it) never recompute them.
+
+SEQUENTIAL_FILE = 'sequential.dat'
+SEQUENTIAL_RUNTIME = 'Sequential_Runtime_(secs.)'
+
+DERIVED_COLUMNS = {
+    'Event_Commitment_Ratio': (
+        ['Events_Processed', 'Events_Committed'],
+        lambda df: df['Events_Processed'] / df['Events_Committed']),
+    'Total_Rollbacks': (
+        ['Primary_Rollbacks', 'Secondary_Rollbacks'],
+        lambda df: df['Primary_Rollbacks'] + df['Secondary_Rollbacks']),
+    'Event_Processing_Rate_(per_sec)': (
+        ['Events_Processed', 'Simulation_Runtime_(secs.)'],
+        lambda df: df['Events_Processed'] / df['Simulation_Runtime_(secs.)']),
+    'Speedup_w.r.t._Sequential_Simulation': (
+        [SEQUENTIAL_RUNTIME, 'Simulation_Runtime_(secs.)'],
+        lambda df: df[SEQUENTIAL_RUNTIME] / df['Simulation_Runtime_(secs.)']),
+}
+
+# Least recently used derived columns kept; every entry holds a whole column
+CACHE_SIZE = 8
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def base_columns(columns):
+    # Replace derived names by the stored columns they are computed from
+    resolved = set()
+    for column in columns:
+        if column in DERIVED_COLUMNS:
+            resolved.update(base_columns(DERIVED_COLUMNS[column][0]))
+        else:
+            resolved.add(column)
+    return resolved
+
+
+def read_sequential(model_dir):
+    # sequential.dat holds "<events> <objects> <runtime>" of the sequential run
+    seq_file = os.path.join(model_dir, SEQUENTIAL_FILE)
+    if not os.path.exists(seq_file):
+        return None
+    with open(seq_file, 'r') as f:
+        fields = f.readline().split()
+    return float(fields[2]) if len(fields) >= 3 else None
+
+
+def dataset_version(files, columns=None, filters=None):
+    # Identifies a loaded frame by its sources and the projection applied to them
+    digest = hashlib.md5()
+    for path in sorted(files):
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    digest.update(repr(sorted(columns) if columns is not None else None).encode())
+    digest.update(repr(filters).encode())
+    return digest.hexdigest()
+
+
+def add_derived(df, columns):
+    # Compute the requested derived columns that the frame does not hold yet
+    version = df.attrs.get('version')
+    for column in columns:
+        if column not in DERIVED_COLUMNS or column in df.columns:
+            continue
+        inputs, compute = DERIVED_COLUMNS[column]
+        add_derived(df, inputs)
+        missing = [name for name in inputs if name not in df.columns]
+        if missing:
+            print(f"Cannot derive {column}: missing {', '.join(missing)}")
+            df[column] = np.nan
+            continue
+
+        key = (version, column)
+        with _cache_lock:
+            cached = _cache.get(key) if version is not None else None
+            if cached is not None:
+                _cache.move_to_end(key)
+        if cached is not None and len(cached) == len(df):
+            df[column] = cached.to_numpy()
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df[column] = compute(df).astype('float64')
+        if version is not None:
+            with _cache_lock:
+                _cache[key] = df[column]
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+    return df
@@ -0,0 +1,282 @@
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from query import ENGINES, TABLE, open_database, run_query
+from topk import top_k
+
+HELP = 'Interactive explorer over the archive database'
+
+# A local web page for slicing the archive interactively. The browser only
+# ever receives aggregated points: every change of a control asks the server
+# for a figure, the server runs one GROUP BY over the indexed `runs` table of
+# `plotthesis query` and answers with a plotly figure of WebGL (scattergl)
+# traces holding the mean, SEM and run count per point. Plotly.js itself is
+# served from the installed plotly package, so no CDN is needed.
+
+# Slicers of the page and the columns they filter
+SLICERS = {'branch': 'branch', 'model': 'Model', 'threads': 'Worker_Thread_Count', 'period': 'State_Save_Period'}
+AXIS_COLUMNS = ['Worker_Thread_Count', 'State_Save_Period', 'branch', 'Model', 'Folder', 'Run_Type', 'Timestamp']
+SERIES_COLUMNS = ['branch', 'Model', 'Folder', 'Run_Type', 'Location', 'Worker_Thread_Count', 'State_Save_Period']
+DEFAULT_METRIC = 'Simulation_Runtime_(secs.)'
+# Series beyond this many are dropped, keeping the ones with the most runs
+MAX_SERIES = 20
+CACHE_SIZE = 256
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>PlotThesis explorer</title>
+<script src="/plotly.min.js"></script>
+<style>
+  body { font-family: sans-serif; margin: 0; display: flex; height: 100vh; }
+  #controls { width: 280px; padding: 12px; overflow-y: auto; border-right: 1px solid #ddd; }
+  #controls label { display: block; margin-top: 10px; font-weight: bold; font-size: 13px; }
+  #controls select, #controls input { width: 100%; }
+  #plot { flex: 1; }
+  #info { font-size: 12px; color: #666; margin-top: 12px; }
+</style>
+</head>
+<body>
+<div id="controls">
+  <label>Metric</label><select id="metric"></select>
+  <label>X axis</label><select id="x"></select>
+  <label>Series</label><select id="series"></select>
+  <label>Branches (comma separated, % as wildcard)</label>
+  <input id="branch" list="branches" placeholder="all">
+  <datalist id="branches"></datalist>
+  <label>Model</label><select id="model" multiple size="4"></select>
+  <label>Threads</label><select id="threads" multiple size="6"></select>
+  <label>State_Save_Period</label><select id="period" multiple size="6"></select>
+  <div id="info"></div>
+</div>
+<div id="plot"></div>
+<script>
+function fill(id, values, selected) {
+  const select = document.getElementById(id);
+  for (const value of values) {
+    const option = new Option(value, value, false, value === selected);
+    select.add(option);
+  }
+}
+
+async function update() {
+  const params = new URLSearchParams();
+  for (const id of ['metric', 'x', 'series', 'branch']) {
+    params.set(id, document.getElementById(id).value);
+  }
+  for (const id of ['model', 'threads', 'period']) {
+    for (const option of document.getElementById(id).selectedOptions) {
+      params.append(id, option.value);
+    }
+  }
+  const started = performance.now();
+  const response = await fetch('/figure?' + params);
+  const answer = await response.json();
+  if (answer.error) {
+    document.getElementById('info').textContent = answer.error;
+    return;
+  }
+  Plotly.react('plot', answer.figure.data, answer.figure.layout, {responsive: true});
+  document.getElementById('info').textContent =
+    answer.points + ' points from ' + answer.runs + ' runs in ' + Math.round(performance.now() - started) + ' ms';
+}
+
+fetch('/options').then(response => response.json()).then(options => {
+  fill('metric', options.metrics, options.default_metric);
+  fill('x', options.axes, 'Worker_Thread_Count');
+  fill('series', ['(none)'].concat(options.series), 'branch');
+  fill('model', options.model);
+  fill('threads', options.threads);
+  fill('period', options.period);
+  const branches = document.getElementById('branches');
+  for (const branch of options.branch) {
+    branches.appendChild(new Option(branch));
+  }
+  for (const element of document.querySelectorAll('select')) {
+    element.addEventListener('change', update);
+  }
+  document.getElementById('branch').addEventListener('change', update);
+  update();
+});
+</script>
+</body>
+</html>
+"""
+
+
+class Explorer:
+    # Aggregating backend of the page, answering from one database connection
+
+    def __init__(self, con):
+        self.con = con
+        sample = run_query(con, f"SELECT * FROM {TABLE} LIMIT 1")
+        self.columns = list(sample.columns)
+        self.metrics = [column for column in sample.select_dtypes('number').columns
+                        if column not in SLICERS.values()]
+        self.cache = {}
+
+    def distinct(self, column):
+        if column not in self.columns:
+            return []
+        values = run_query(self.con, f'SELECT DISTINCT "{column}" AS value FROM {TABLE} ORDER BY 1')['value']
+        return [value.item() if hasattr(value, 'item') else value for value in values.dropna()]
+
+    def options(self):
+        options = {name: self.distinct(column) for name, column in SLICERS.items()}
+        options.update({
+            'metrics': self.metrics,
+            'default_metric': DEFAULT_METRIC,
+            'axes': [column for column in AXIS_COLUMNS if column in self.columns],
+            'series': [column for column in SERIES_COLUMNS if column in self.columns],
+        })
+        return options
+
+    def where(self, params):
+        # Parameterized WHERE clause; only known column names are interpolated
+        clauses, values = [], []
+        names = [name.strip() for name in params.get('branch', [''])[0].split(',') if name.strip()]
+        if names:
+            clauses.append('(' + ' OR '.join('branch LIKE ?' if '%' in name else 'branch = ?' for name in names) + ')')
+            values.extend(names)
+        for name in ('model', 'threads', 'period'):
+            selected = params.get(name, [])
+            if selected:
+                column = SLICERS[name]
+                clauses.append(f'"{column}" IN ({", ".join("?" * len(selected))})')
+                values.extend(float(value) if name != 'model' else value for value in selected)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', values
+
+    def aggregate(self, metric, x, series, params):
+        # mean, SEM and run count per (series, x) computed by the database. The
+        # variance takes two passes, summing squared deviations from each
+        # group's mean (a window AVG), since AVG(x * x) - mean ** 2 cancels
+        # catastrophically for large, nearly constant metrics
+        where, values = self.where(params)
+        keys = [x] if series is None else [series, x]
+        select = ', '.join(f'"{key}"' for key in keys)
+        sql = (f'SELECT {select}, COUNT(value) AS runs, AVG(value) AS mean, '
+               f'SUM((value - group_mean) * (value - group_mean)) AS m2 FROM ('
+               f'SELECT {select}, "{metric}" AS value, AVG("{metric}") OVER (PARTITION BY {select}) AS group_mean '
+               f'FROM {TABLE}{where}) AS grouped GROUP BY {select} ORDER BY {select}')
+        df = run_query(self.con, sql, values)
+        variance = df['m2'] / (df['runs'] - 1)
+        df['sem'] = np.sqrt(variance.clip(lower=0)) / np.sqrt(df['runs'])
+        return df.drop(columns='m2')
+
+    def figure(self, params):
+        import plotly.graph_objects as go
+
+        metric = params.get('metric', [DEFAULT_METRIC])[0]
+        x = params.get('x', ['Worker_Thread_Count'])[0]
+        series = params.get('series', ['branch'])[0]
+        series = None if series in ('', '(none)') or series == x else series
+        if metric not in self.metrics or x not in self.columns or (series and series not in self.columns):
+            raise ValueError(f"Unknown column in {metric!r}, {x!r}, {series!r}")
+
+        df = self.aggregate(metric, x, series, params)
+        title = f"{metric} by {x}"
+        groups = [(None, df)] if series is None else list(df.groupby(series, sort=False))
+        if len(groups) > MAX_SERIES:
+            runs = df.groupby(series, sort=False)['runs'].sum().reset_index()
+            kept = set(top_k(runs, MAX_SERIES, 'runs', ascending=False)[series])
+            groups = [group for group in groups if group[0] in kept]
+            title += f" ({MAX_SERIES} of {runs.shape[0]} {series} values with the most runs)"
+
+        numeric_x = pd.api.types.is_numeric_dtype(df[x])
+        fig = go.Figure()
+        for name, group in groups:
+            fig.add_trace(go.Scattergl(
+                x=group[x], y=group['mean'], name=str(name) if name is not None else metric,
+                mode='lines+markers' if numeric_x else 'markers',
+                error_y={'type': 'data', 'array': group['sem'], 'visible': True},
+                customdata=group['runs'], hovertemplate='%{x}<br>%{y:.4g}<br>%{customdata} runs'))
+        fig.update_layout(title=title, xaxis_title=x, yaxis_title=metric, template='plotly_white',
+                          legend_title=series or '')
+        if not numeric_x:
+            fig.update_xaxes(type='category')
+        return {'figure': json.loads(fig.to_json()), 'points': int(df.shape[0]), 'runs': int(df['runs'].sum())}
+
+    def cached_figure(self, query):
+        # The archive database only changes when the explorer is restarted, so
+        # answers are reused for repeated slices
+        if query not in self.cache:
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[query] = self.figure(parse_qs(query))
+        return self.cache[query]
+
+
+def make_handler(explorer):
+    import plotly.offline
+
+    plotly_js = plotly.offline.get_plotlyjs().encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def send(self, body, content_type, status=200):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, data, status=200):
+            self.send(json.dumps(data).encode('utf-8'), 'application/json', status)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/':
+                self.send(PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+            elif url.path == '/plotly.min.js':
+                self.send(plotly_js, 'application/javascript')
+            elif url.path == '/options':
+                self.send_json(explorer.options())
+            elif url.path == '/figure':
+                try:
+                    self.send_json(explorer.cached_figure(url.query))
+                except Exception as error:
+                    self.send_json({'error': str(error)}, 400)
+            else:
+                self.send(b'Not found', 'text/plain', 404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('--engine', choices=ENGINES, help='Database engine (default: duckdb if installed, else sqlite)')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8050, help='Port to listen on (default 8050)')
+
+
+def run(args):
+    con = open_database(args.directory, args.engine)
+    explorer = Explorer(con)
+    # Requests are served one at a time on this thread, which owns the connection
+    server = HTTPServer((args.host, args.port), make_handler(explorer))
+    print(f"Explorer for {args.directory} at http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
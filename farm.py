@@ -0,0 +1,327 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+import customGraphs
+import customHistograms
+from dataloader import find_csv, load_folders, match_model
+from plotspec import config_columns, group_configs, load_spec
+from render import SVG_PROFILES, set_svg_profile
+
+HELP = 'Render farm over a job queue on a shared filesystem'
+
+# The coordinator writes one JSON job file per (run type, model, plot config)
+# plus one per histogram config into <queue>/pending. Workers on any node that
+# mounts the queue claim a job by renaming it into <queue>/claimed (a rename is
+# atomic, so exactly one worker wins), render into their own
+# <queue>/results/<job>.<host>.<pid>, and on finishing rename that directory to
+# <queue>/results/<job> and move the job to done or failed. A worker whose job
+# was requeued in the meantime only ever deletes its own directory, so it cannot
+# destroy the results of the worker that reclaimed the job. `collect` moves the
+# staged results into the results root. Paths in the jobs are relative to the queue directory, so the
+# mount point may differ between nodes.
+STATES = ['pending', 'claimed', 'done', 'failed', 'collected']
+POLL_INTERVAL = 1.0
+# A running job's claim file is touched this often, so --requeue-after must be
+# well above it
+HEARTBEAT_INTERVAL = 5.0
+
+
+def queue_path(queue, *parts):
+    return os.path.join(queue, *parts)
+
+
+def to_queue(queue, path):
+    return os.path.relpath(path, queue)
+
+
+def from_queue(queue, path):
+    return os.path.normpath(os.path.join(queue, path))
+
+
+def write_job(queue, job):
+    # Written under a temporary name first so a worker never claims a partial file
+    path = queue_path(queue, 'pending', f"{job['id']}.json")
+    with open(path + '.tmp', 'w') as f:
+        json.dump(job, f, indent=2)
+    os.rename(path + '.tmp', path)
+
+
+def submit(root_dir, queue, configs, histogram_configs, svg):
+    for state in STATES + ['results']:
+        os.makedirs(queue_path(queue, state), exist_ok=True)
+
+    jobs = []
+    for run_type in sorted(os.listdir(root_dir)):
+        run_dir = os.path.join(root_dir, run_type)
+        if not os.path.isdir(run_dir):
+            continue
+        for model in sorted(os.listdir(run_dir)):
+            model_dir = os.path.join(run_dir, model)
+            if not os.path.isdir(model_dir) or not find_csv(model_dir):
+                continue
+            for index, config in enumerate(configs):
+                if match_model(model, config.get('model')):
+                    jobs.append({'kind': 'graphs', 'name': f"{run_type}-{model}-{index}",
+                                 'input': to_queue(queue, model_dir), 'output_dir': to_queue(queue, run_dir),
+                                 'config': config})
+    for index, config in enumerate(histogram_configs):
+        jobs.append({'kind': 'histograms', 'name': f"histograms-{index}", 'input': to_queue(queue, root_dir),
+                     'output_dir': to_queue(queue, os.path.join(root_dir, 'Top Performers')), 'config': config})
+
+    for number, job in enumerate(jobs):
+        job['id'] = f"{number:05d}-{job['name']}"
+        job['svg'] = svg
+        write_job(queue, job)
+    print(f"Submitted {len(jobs)} jobs to {queue}")
+
+
+def run_graphs(queue, job, staging):
+    config = job['config']
+    group = group_configs([config])[0]
+    dataframes = load_folders(glob.escape(from_queue(queue, job['input'])), columns=group['columns'],
+                              filters=group['filters'], model=group['model'])
+    if not dataframes:
+        print(f"No data found for {config['title']}")
+        return
+    customGraphs.plothandler(pd.concat(dataframes.values(), ignore_index=True), config, staging)
+
+
+def run_histograms(queue, job, staging):
+    config = job['config']
+    columns = config_columns(config) | {'branch'}
+    dataframe = customHistograms.process_csvs(from_queue(queue, job['input']), config['model'], columns,
+                                              config.get('filters'))
+    if dataframe is None:
+        print(f"No data found for {config['model']}")
+        return
+    customHistograms.data_maker(dataframe, config, staging)
+
+
+JOB_KINDS = {'graphs': run_graphs, 'histograms': run_histograms}
+
+
+def claim(queue, worker):
+    # Returns (job file, job) of a claimed job or None when nothing is pending
+    for name in sorted(os.listdir(queue_path(queue, 'pending'))):
+        if not name.endswith('.json'):
+            continue
+        claimed = queue_path(queue, 'claimed', f"{name[:-5]}@{worker}.json")
+        try:
+            os.rename(queue_path(queue, 'pending', name), claimed)
+        except FileNotFoundError:
+            continue  # another worker won
+        # A rename keeps the submit-time mtime, which requeue_stale would take
+        # for the claim time
+        os.utime(claimed)
+        with open(claimed) as f:
+            return claimed, json.load(f)
+    return None
+
+
+def requeue_stale(queue, timeout):
+    # Jobs whose claim has not been refreshed for timeout seconds belong to a
+    # worker that died and go back to pending
+    now = time.time()
+    for name in os.listdir(queue_path(queue, 'claimed')):
+        path = queue_path(queue, 'claimed', name)
+        if now - os.path.getmtime(path) > timeout:
+            try:
+                os.rename(path, queue_path(queue, 'pending', name.split('@')[0] + '.json'))
+                print(f"Requeued stale job {name}")
+            except FileNotFoundError:
+                pass
+
+
+def heartbeat(path, stop):
+    # Touch the claim file until stop is set, so a job that runs longer than
+    # --requeue-after is not taken for one whose worker died
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+def finish(queue, path, job, state, staging):
+    # Move the claim to its final state and the worker's staging directory to
+    # results/<job>; False when the claim was requeued in the meantime and the
+    # job now belongs to another worker, whose results are left alone
+    final = queue_path(queue, state, f"{job['id']}.json")
+    try:
+        os.rename(path, final + '.tmp')
+    except FileNotFoundError:
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    # Only the owner of the claim gets here, so the results of an earlier
+    # attempt at this job are its own to replace
+    results = queue_path(queue, 'results', job['id'])
+    shutil.rmtree(results, ignore_errors=True)
+    os.rename(staging, results)
+    with open(final + '.tmp', 'w') as f:
+        json.dump(job, f, indent=2)
+    os.rename(final + '.tmp', final)
+    return True
+
+
+def work(queue, requeue_after=None, wait=False):
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+    while True:
+        if requeue_after:
+            requeue_stale(queue, requeue_after)
+        claimed = claim(queue, worker)
+        if claimed is None:
+            if wait:
+                time.sleep(POLL_INTERVAL)
+                continue
+            break
+
+        path, job = claimed
+        staging = queue_path(queue, 'results', f"{job['id']}.{socket.gethostname()}.{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        set_svg_profile(job['svg'])
+
+        start = time.time()
+        stop = threading.Event()
+        threading.Thread(target=heartbeat, args=(path, stop), daemon=True).start()
+        try:
+            JOB_KINDS[job['kind']](queue, job, staging)
+            state = 'done'
+        except Exception:
+            job['error'] = traceback.format_exc()
+            print(f"[{worker}] {job['id']} failed:\n{job['error']}")
+            state = 'failed'
+        finally:
+            stop.set()
+        job.update({'worker': worker, 'start': start, 'end': time.time()})
+
+        if not finish(queue, path, job, state, staging):
+            print(f"[{worker}] {job['id']} was requeued while running, result left to the worker that reclaimed it")
+            continue
+        processed += 1
+        print(f"[{worker}] {job['id']} {state} in {job['end'] - start:.2f}s")
+    print(f"[{worker}] no pending jobs left, processed {processed}")
+
+
+def start_workers(queue, processes, requeue_after, wait):
+    # Several local worker processes, e.g. to try the farm on one machine
+    command = [sys.executable, os.path.abspath(__file__), 'work', queue]
+    if requeue_after:
+        command += ['--requeue-after', str(requeue_after)]
+    if wait:
+        command += ['--wait']
+    workers = [subprocess.Popen(command) for _ in range(processes)]
+    return max(worker.wait() for worker in workers)
+
+
+def read_jobs(queue, state):
+    jobs = []
+    for path in sorted(glob.glob(queue_path(queue, state, '*.json'))):
+        with open(path) as f:
+            jobs.append(json.load(f))
+    return jobs
+
+
+def status(queue):
+    for state in STATES:
+        print(f"{state}: {len(glob.glob(queue_path(queue, state, '*.json')))}")
+    finished = read_jobs(queue, 'done') + read_jobs(queue, 'collected')
+    if not finished:
+        return
+    runs = pd.DataFrame(finished)
+    runs['seconds'] = runs['end'] - runs['start']
+    per_worker = runs.groupby('worker').agg(jobs=('id', 'size'), busy_seconds=('seconds', 'sum'))
+    wall = runs['end'].max() - runs['start'].min()
+    print(f"\nWall time {wall:.2f}s for {len(runs)} jobs ({len(runs) / wall:.2f} jobs/s)")
+    print(per_worker.to_string())
+
+
+def collect(queue):
+    # Move staged figures into place; the data files of the jobs that share a
+    # name (one per model of a run type) are concatenated
+    written = set()
+    collected = 0
+    for job in read_jobs(queue, 'done'):
+        staging = queue_path(queue, 'results', job['id'])
+        output_dir = from_queue(queue, job['output_dir'])
+        os.makedirs(output_dir, exist_ok=True)
+        for name in sorted(os.listdir(staging)) if os.path.isdir(staging) else []:
+            source, destination = os.path.join(staging, name), os.path.join(output_dir, name)
+            if name.endswith('.txt') and destination in written:
+                with open(source) as src, open(destination, 'a') as dst:
+                    dst.write(src.read())
+            else:
+                shutil.move(source, destination)
+            written.add(destination)
+        shutil.rmtree(staging, ignore_errors=True)
+        # Staging directories of workers that died while running this job
+        for leftover in glob.glob(queue_path(queue, 'results', f"{glob.escape(job['id'])}.*")):
+            shutil.rmtree(leftover, ignore_errors=True)
+        os.rename(queue_path(queue, 'done', f"{job['id']}.json"), queue_path(queue, 'collected', f"{job['id']}.json"))
+        collected += 1
+
+    failed = glob.glob(queue_path(queue, 'failed', '*.json'))
+    print(f"Collected {collected} jobs ({len(written)} files), {len(failed)} failed")
+    return not failed
+
+
+def add_arguments(parser):
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    submit_parser = actions.add_parser('submit', help='Split a results root into jobs')
+    submit_parser.add_argument('root_dir', help='Results root, e.g. completed_logs_big')
+    submit_parser.add_argument('--queue', help='Queue directory on the shared filesystem (default <root_dir>/.farm)')
+    submit_parser.add_argument('--spec', help='TOML/YAML plot spec to use instead of the built-in customGraphs configs')
+    submit_parser.add_argument('--svg', choices=SVG_PROFILES, default='default', help='SVG output profile of the jobs')
+
+    work_parser = actions.add_parser('work', help='Claim and render jobs until none are pending')
+    work_parser.add_argument('queue', help='Queue directory')
+    work_parser.add_argument('--processes', type=int, default=1, help='Number of local worker processes')
+    work_parser.add_argument('--requeue-after', type=float,
+                             help=f'Return jobs whose claim was last refreshed more than this many seconds ago to pending '
+                                  f'(running jobs refresh it every {HEARTBEAT_INTERVAL:.0f}s)')
+    work_parser.add_argument('--wait', action='store_true', help='Keep polling for new jobs instead of exiting')
+
+    status_parser = actions.add_parser('status', help='Count jobs per state and report per-worker throughput')
+    status_parser.add_argument('queue', help='Queue directory')
+
+    collect_parser = actions.add_parser('collect', help='Move rendered results into the results root')
+    collect_parser.add_argument('queue', help='Queue directory')
+
+
+def run(args):
+    if args.action == 'submit':
+        queue = args.queue or os.path.join(args.root_dir, '.farm')
+        configs = load_spec(args.spec) if args.spec else customGraphs.plot_configs
+        submit(args.root_dir, queue, configs, customHistograms.configs, args.svg)
+    elif args.action == 'work':
+        if args.processes > 1:
+            sys.exit(start_workers(args.queue, args.processes, args.requeue_after, args.wait))
+        work(args.queue, args.requeue_after, args.wait)
+    elif args.action == 'status':
+        status(args.queue)
+    elif args.action == 'collect':
+        if not collect(args.queue):
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,12 @@ import os
 from pathlib import Path
 import subprocess
 import argparse
-import re
 import hashlib
 import errno
 import shutil
 
+from rundirs import remove_timestamp
+
 def latex_escape(text):
     special_chars = {
         '&': r'\&',
@@ -22,8 +23,8 @@ def latex_escape(text):
     }
     return ''.join(special_chars.get(c, c) for c in text)
 
-def remove_timestamp(text):
-    return re.sub(r'_\d{14}', '', text)
+# Plain and gzipped SVG figures
+SVG_EXTENSIONS = ('.svg', '.svgz')
 
 def create_unique_filename(rel_path, svg_file):
     unique_id = hashlib.md5(f"{rel_path}_{svg_file}".encode()).hexdigest()[:8]
@@ -60,7 +61,7 @@ def create_latex_content(root_dir):
     
     svg_dirs = []
     for root, dirs, files in os.walk(root_dir):
-        svg_files = [f for f in files if f.lower().endswith('.svg')]
+        svg_files = [f for f in files if f.lower().endswith(SVG_EXTENSIONS)]
         if svg_files:
             rel_path = os.path.relpath(root, root_dir)
             svg_dirs.append((rel_path, svg_files))
@@ -93,11 +94,19 @@ def create_latex_content(root_dir):
                 else:
                     raise
             
-            caption = latex_escape(svg_file[:-4])
+            name, extension = os.path.splitext(svg_file)
+            caption = latex_escape(name)
+            # Inkscape draws the text of lean SVGs itself, since labels such as
+            # Simulation_Runtime_(secs.) are not valid LaTeX. The svg package
+            # looks for <name>.svg unless told the extension
+            options = 'width=0.9\\textwidth, height=0.4\\textheight, keepaspectratio, inkscapelatex=false'
+            if extension.lower() == '.svgz':
+                options += ', extension=svgz'
+                unique_img_path = os.path.splitext(unique_img_path)[0]
             content.extend([
                 r'\begin{figure}[H]',
                 r'\centering',
-                f'\\includesvg[width=0.9\\textwidth, height=0.4\\textheight, keepaspectratio]{{{unique_img_path}}}',
+                f'\\includesvg[{options}]{{{unique_img_path}}}',
                 f'\\caption{{{caption}}}',
                 r'\end{figure}',
                 r'\vspace{1cm}'
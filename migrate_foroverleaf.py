@@ -5,7 +5,7 @@ import re
 
 def copy_files(source_dir, destination_dir):
     # Compile the regex pattern for matching SVG files with ID
-    svg_pattern = re.compile(r'^[a-zA-Z0-9]+_.*\.svg$', re.IGNORECASE)
+    svg_pattern = re.compile(r'^[a-zA-Z0-9]+_.*\.svgz?$', re.IGNORECASE)
 
     for root, dirs, files in os.walk(source_dir):
         # Skip the svg-inkscape folder
@@ -17,9 +17,9 @@ def copy_files(source_dir, destination_dir):
         dest_path = os.path.join(destination_dir, relative_path)
         os.makedirs(dest_path, exist_ok=True)
 
-        # Copy SVG (with ID), TEX, and PDF files
+        # Copy SVG/SVGZ (with ID), TEX, and PDF files
         for file in files:
-            if file.lower().endswith('.svg'):
+            if file.lower().endswith(('.svg', '.svgz')):
                 if svg_pattern.match(file):
                     source_file = os.path.join(root, file)
                     dest_file = os.path.join(dest_path, file)
@@ -0,0 +1,206 @@
+import argparse
+import bisect
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataloader import load_archive
+from render import SVG_PROFILES, new_figure, save_figure, set_svg_profile
+
+HELP = 'Pareto front of branches over runtime, memory and rollbacks'
+
+# All metrics are minimized
+METRICS = ['Simulation_Runtime_(secs.)', 'Average_Memory_Usage_(MB)', 'Primary_Rollbacks']
+RUNTIME = 'Simulation_Runtime_(secs.)'
+
+
+def skyline_2d(values):
+    # Sort by the first metric (ties by the second) and sweep: a point is on the
+    # front when it beats the best second metric seen so far. O(n log n)
+    order = np.lexsort((values[:, 1], values[:, 0]))
+    mask = np.zeros(len(values), dtype=bool)
+    best = np.inf
+    for i in order:
+        if values[i, 1] < best:
+            mask[i] = True
+            best = values[i, 1]
+    return mask
+
+
+def skyline_3d(values):
+    # Sweep in order of the first metric while keeping the 2-D staircase of the
+    # front so far (second metric ascending, third strictly descending). A point
+    # is dominated when the staircase step at or left of its second metric is not
+    # above its third metric. O(n log n) searches on the staircase
+    order = np.lexsort((values[:, 2], values[:, 1], values[:, 0]))
+    mask = np.zeros(len(values), dtype=bool)
+    keys, heights = [], []
+    for i in order:
+        m2, m3 = values[i, 1], values[i, 2]
+        pos = bisect.bisect_right(keys, m2)
+        if pos > 0 and heights[pos - 1] <= m3:
+            continue
+        mask[i] = True
+        # Drop the steps the new point dominates in the projection
+        end = pos
+        while end < len(keys) and heights[end] >= m3:
+            end += 1
+        keys[pos:end] = [m2]
+        heights[pos:end] = [m3]
+    return mask
+
+
+def skyline_sfs(values):
+    # Sort-filter-skyline for more than three metrics: after a lexicographic
+    # sort over all metrics a point can only be dominated by an earlier one, so
+    # each point is only compared against the front found so far
+    # (O(n * |front|) after the sort)
+    mask = np.zeros(len(values), dtype=bool)
+    front = []
+    for i in np.lexsort(values.T[::-1]):
+        point = values[i]
+        if any(np.all(q <= point) and np.any(q < point) for q in front):
+            continue
+        mask[i] = True
+        front.append(point)
+    return mask
+
+
+def pareto_front(values):
+    # Boolean mask of the non-dominated rows of an (n, k) array to be minimized
+    values = np.asarray(values, dtype='float64')
+    if len(values) == 0:
+        return np.zeros(0, dtype=bool)
+    if values.shape[1] == 1:
+        return values[:, 0] == values[:, 0].min()
+    if values.shape[1] == 2:
+        return skyline_2d(values)
+    if values.shape[1] == 3:
+        return skyline_3d(values)
+    return skyline_sfs(values)
+
+
+def branch_means(df, metrics):
+    # Mean per run type first, then averaged over run types, as customHistograms does
+    per_path = df.groupby(['Folder', 'path', 'branch'])[metrics].mean()
+    return per_path.groupby(level=['Folder', 'branch']).mean()
+
+
+def model_fronts(means, metrics):
+    fronts = []
+    for folder, model_means in means.groupby(level='Folder', sort=False):
+        model_means = model_means.dropna()
+        model_means = model_means.assign(Pareto=pareto_front(model_means[metrics].to_numpy()))
+        fronts.append(model_means)
+    return pd.concat(fronts)
+
+
+def cross_model_rank(means, metrics):
+    # Every metric is normalized by the best branch of each model and combined
+    # across models with a geometric mean; the ranking uses runtime. A model
+    # whose best value of a metric is not positive (no rollbacks at all) cannot
+    # be divided by, so its values are shifted to (x - best + ref) / ref with
+    # ref the smallest positive value of that model, which keeps the best branch
+    # at 1; these (model, metric) pairs are listed in attrs['shifted']. Only
+    # branches measured on every model are ranked and on the front: a geometric
+    # mean over fewer models is not comparable, so the others only report the
+    # number of models they cover
+    means = means[metrics].dropna()
+    best = means.groupby(level='Folder').transform('min')
+    ref = means.where(means > 0).groupby(level='Folder').transform('min')
+    shifted = best <= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = (means / best).mask(shifted, (means - best + ref) / ref)
+    # A metric that is 0 for every branch of a model does not tell them apart
+    normalized = normalized.mask(shifted & ref.isna(), 1.0)
+
+    combined = np.exp(np.log(normalized).groupby(level='branch').mean())
+    columns = [f"GeoMean_Normalized_{metric}" for metric in metrics]
+    combined.columns = columns
+    combined['Models'] = normalized.groupby(level='branch').size()
+    complete = combined['Models'] == means.index.get_level_values('Folder').nunique()
+    combined['Pareto'] = False
+    combined.loc[complete, 'Pareto'] = pareto_front(combined.loc[complete, columns].to_numpy())
+    key = f"GeoMean_Normalized_{RUNTIME}"
+    combined = pd.concat([combined[complete].sort_values(key),
+                          combined[~complete].sort_values(['Models', key], ascending=[False, True])])
+    combined['Rank'] = pd.array(list(range(1, complete.sum() + 1)) + [None] * (~complete).sum(), dtype='Int64')
+    combined.attrs['shifted'] = [(folder, metric) for folder, metric in
+                                 shifted.groupby(level='Folder').any().stack().loc[lambda s: s].index]
+    return combined
+
+
+def plot_front(data, x_col, y_col, title, filepath):
+    fig, ax = new_figure((15, 8))
+    dominated = data[~data['Pareto']]
+    front = data[data['Pareto']].sort_values(x_col)
+    ax.scatter(dominated[x_col], dominated[y_col], color='lightgray', edgecolor='gray', s=60, label='Dominated')
+    ax.plot(front[x_col], front[y_col], marker='o', color='#4472C4', markersize=9, label='Pareto front')
+    for branch, row in data.iterrows():
+        ax.annotate(branch if isinstance(branch, str) else branch[-1], (row[x_col], row[y_col]),
+                    textcoords='offset points', xytext=(5, 5), fontsize=9)
+    ax.set_xlabel(x_col, fontsize=12)
+    ax.set_ylabel(y_col, fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.grid(True, linestyle='--', alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    filepath = save_figure(fig, filepath, bbox_inches='tight', dpi=300)
+    print(f"Saved plot to {filepath}")
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('--model', help='Only analyze model directories containing this keyword')
+    parser.add_argument('--svg', choices=SVG_PROFILES, default='default',
+                        help='SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)')
+    parser.add_argument('--latest', action='store_true', help='Only read the newest run directory of every run type')
+    parser.add_argument('--metrics', nargs='+', default=METRICS, help='Metrics to minimize (first two are plotted)')
+
+
+def run(args):
+    set_svg_profile(args.svg)
+    metrics = args.metrics
+    df = load_archive(args.directory, args.model, set(metrics) | {'branch'}, latest=args.latest)
+    if df is None:
+        return
+
+    output_dir = os.path.join(args.directory, 'Pareto')
+    os.makedirs(output_dir, exist_ok=True)
+
+    means = branch_means(df, metrics)
+    fronts = model_fronts(means, metrics)
+    combined = cross_model_rank(means, metrics)
+
+    with open(os.path.join(output_dir, 'pareto_data.txt'), 'w') as f:
+        f.write("Per-model branch means and Pareto membership\n\n")
+        f.write(fronts.reset_index().to_string(index=False))
+        f.write("\n\nCross-model ranking by geometric-mean normalized runtime "
+                "(branches missing from a model are not ranked)\n\n")
+        f.write(combined.reset_index().to_string(index=False))
+        f.write("\n")
+        if combined.attrs['shifted']:
+            f.write("\nShifted by the smallest positive value before normalizing (best value not positive):\n")
+            f.writelines(f"{folder}: {metric}\n" for folder, metric in combined.attrs['shifted'])
+    print(f"Cross-model ranking:\n{combined}")
+    for folder, metric in combined.attrs['shifted']:
+        print(f"Warning: best {metric} on {folder} is not positive; its values were shifted before normalizing")
+
+    x_col, y_col = metrics[0], metrics[1] if len(metrics) > 1 else metrics[0]
+    for folder, model_front in fronts.groupby(level='Folder', sort=False):
+        plot_front(model_front, x_col, y_col, f"Pareto Front on {folder}",
+                   os.path.join(output_dir, f"Pareto_{folder}.svg"))
+    plot_front(combined[combined['Rank'].notna()], f"GeoMean_Normalized_{x_col}", f"GeoMean_Normalized_{y_col}",
+               "Cross-Model Pareto Front (geometric-mean normalized)",
+               os.path.join(output_dir, "Pareto_cross_model.svg"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from dataloader import COLUMN_DTYPES, DECOMPRESSORS, find_result
+
+HELP = 'Parse raw simulator logs and append them as scheduleq rows'
+
+# Streams raw simulator logs into scheduleq rows.
+#
+# Every line of the form "<field> : <value>" or "<field> = <value>" whose field
+# name matches one of the columns listed in `variables` (case, spacing and
+# punctuation are ignored, so "Simulation Runtime (secs.): 35.1" fills
+# Simulation_Runtime_(secs.)) is captured. A log holding several runs is split
+# into several rows whenever a field that was already captured shows up again.
+# The rows go to the model directory's existing scheduleq file, compressed or
+# not: gzip, bz2 and xz files get one more stream, which their readers
+# concatenate, so a compressed archive never gains a plain scheduleq.csv next
+# to it. zstd frames are not read across, so a .csv.zst target is refused.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VARIABLES_FILE = os.path.join(SCRIPT_DIR, 'variables')
+RESULT_STEM = 'scheduleq'
+
+LINE_PATTERN = re.compile(r'^\s*(?P<key>[A-Za-z][^:=]*?)\s*[:=]\s*(?P<value>.*?)\s*$')
+
+
+def normalize_key(text):
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def read_variables(path=VARIABLES_FILE):
+    with open(path, 'r') as f:
+        return [name.strip() for name in f.read().split(',') if name.strip()]
+
+
+def parse_log(log_file, columns, constants=None):
+    keys = {normalize_key(column): column for column in columns}
+    rows = []
+    row = dict(constants or {})
+
+    with open(log_file, 'r', errors='replace') as f:
+        for line in f:
+            match = LINE_PATTERN.match(line)
+            if not match:
+                continue
+            column = keys.get(normalize_key(match.group('key')))
+            if column is None:
+                continue
+            if column in row and column not in (constants or {}):
+                rows.append(row)
+                row = dict(constants or {})
+            row[column] = match.group('value')
+
+    if len(row) > len(constants or {}):
+        rows.append(row)
+    return rows
+
+
+def typed_frame(rows, columns):
+    df = pd.DataFrame(rows, columns=columns)
+    for column in columns:
+        dtype = COLUMN_DTYPES.get(column)
+        if dtype in ('int64', 'float64'):
+            values = pd.to_numeric(df[column], errors='coerce')
+            # Missing counters cannot be held as int64
+            df[column] = values.astype(dtype) if dtype == 'float64' or not values.isna().any() else values
+    return df
+
+
+def append_rows(df, result_file):
+    # Rows are appended to the existing result file; it is never rewritten
+    opener = DECOMPRESSORS.get(os.path.splitext(result_file)[1], open)
+    write_header = not os.path.exists(result_file) or os.path.getsize(result_file) == 0
+    if not write_header and opener is not open:
+        with opener(result_file, 'rb') as f:
+            write_header = not f.read(1)
+    with opener(result_file, 'ab') as f:
+        f.write(df.to_csv(header=write_header, index=False).encode())
+
+
+def target_file(output_dir):
+    # The model directory's scheduleq file in whatever form it is kept
+    result_file = find_result(output_dir, RESULT_STEM) or os.path.join(output_dir, RESULT_STEM + '.csv')
+    ext = os.path.splitext(result_file)[1]
+    if ext != '.csv' and ext not in DECOMPRESSORS:
+        raise ValueError(f"Cannot append to {result_file}; decompress it first")
+    return result_file
+
+
+def parse_logs(log_files, output_dir, constants=None, jobs=None):
+    columns = read_variables()
+    os.makedirs(output_dir, exist_ok=True)
+    result_file = target_file(output_dir)
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(parse_log, log_files, [columns] * len(log_files), [constants] * len(log_files))
+        for log_file, rows in zip(log_files, results):
+            if not rows:
+                print(f"No fields found in {log_file}")
+                continue
+            missing = [column for column in columns if any(column not in row for row in rows)]
+            if missing:
+                print(f"Warning: {log_file} is missing {', '.join(missing)}")
+            append_rows(typed_frame(rows, columns), result_file)
+            total += len(rows)
+
+    print(f"Appended {total} rows from {len(log_files)} logs to {result_file}")
+    return total
+
+
+def parse_constants(assignments):
+    constants = {}
+    for assignment in assignments or []:
+        if '=' not in assignment:
+            raise argparse.ArgumentTypeError(f"Expected FIELD=VALUE, got '{assignment}'")
+        key, value = assignment.split('=', 1)
+        constants[key.strip()] = value.strip()
+    return constants
+
+
+def add_arguments(parser):
+    parser.add_argument('output_dir', help='Model directory whose scheduleq file receives the rows')
+    parser.add_argument('logs', nargs='+', help='Log files or glob patterns')
+    parser.add_argument('--set', dest='constants', action='append', metavar='FIELD=VALUE',
+                        help='Value for a field the logs do not print (e.g. --set branch=master)')
+    parser.add_argument('--jobs', type=int, default=None, help='Number of parallel parser processes')
+
+
+def run(args):
+    log_files = sorted({path for pattern in args.logs for path in glob.glob(pattern) if os.path.isfile(path)})
+    if not log_files:
+        print('No log files found')
+        return
+
+    parse_logs(log_files, args.output_dir, parse_constants(args.constants), args.jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from render import SVG_PROFILES
+
+HELP = 'Run the full plotting pipeline as a task graph'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs the steps of runall.sh as a dependency graph:
+#
+#   clean -> render:<run type> (ingest, aggregate, render per run directory) -+
+#         -> histograms (ingest, aggregate, render over the whole root)  ----+-> latex -+-> export
+#   clear-export (empties the export destination) ------------------------------------+
+#
+# Nodes whose dependencies are done run concurrently on a worker pool.
+
+
+def script(name):
+    return os.path.join(SCRIPT_DIR, name)
+
+
+def build_tasks(root_dir, overleaf_dir, svg='default'):
+    tasks = {
+        'clean': {'command': [script('deletePlot.sh'), root_dir], 'deps': []},
+    }
+
+    render_tasks = []
+    for entry in sorted(os.listdir(root_dir)):
+        run_dir = os.path.join(root_dir, entry)
+        if os.path.isdir(run_dir):
+            name = f"render:{entry}"
+            tasks[name] = {'command': [sys.executable, script('customGraphs.py'), os.path.join(run_dir, '*'),
+                                       '--svg', svg],
+                           'deps': ['clean']}
+            render_tasks.append(name)
+
+    tasks['histograms'] = {'command': [sys.executable, script('customHistograms.py'), root_dir, '--svg', svg],
+                           'deps': ['clean']}
+    tasks['latex'] = {'command': [sys.executable, script('generateLatex.py'), root_dir],
+                      'deps': render_tasks + ['histograms']}
+    tasks['clear-export'] = {'command': ['rm', '-rf', overleaf_dir], 'deps': []}
+    tasks['export'] = {'command': [sys.executable, script('migrate_foroverleaf.py'), root_dir, overleaf_dir],
+                       'deps': ['latex', 'clear-export']}
+    return tasks
+
+
+def run_task(name, task):
+    start = time.time()
+    result = subprocess.run(task['command'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return name, result.returncode, result.stdout, start, time.time()
+
+
+def run_dag(tasks, workers=None):
+    # Returns {name: (start, end)} of the tasks that succeeded and the set of
+    # tasks that failed or were skipped because a dependency failed
+    pending = dict(tasks)
+    timings = {}
+    failed = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while pending or running:
+            for name, task in list(pending.items()):
+                if any(dep in failed for dep in task['deps']):
+                    print(f"[{name}] skipped, a dependency failed")
+                    failed.add(name)
+                    del pending[name]
+                elif all(dep in timings for dep in task['deps']):
+                    print(f"[{name}] started")
+                    running[pool.submit(run_task, name, task)] = name
+                    del pending[name]
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, returncode, output, start, end = future.result()
+                del running[future]
+                for line in output.splitlines():
+                    print(f"[{name}] {line}")
+                if returncode == 0:
+                    timings[name] = (start, end)
+                    print(f"[{name}] finished in {end - start:.2f}s")
+                else:
+                    failed.add(name)
+                    print(f"[{name}] failed with exit code {returncode}")
+
+    return timings, failed
+
+
+def critical_path(tasks, timings):
+    # Longest chain of task durations through the graph
+    longest = {}
+
+    def visit(name):
+        if name not in longest:
+            start, end = timings[name]
+            deps = [dep for dep in tasks[name]['deps'] if dep in timings]
+            best = max(deps, key=lambda dep: visit(dep)[0], default=None)
+            before, chain = visit(best) if best else (0.0, [])
+            longest[name] = (before + end - start, chain + [name])
+        return longest[name]
+
+    return max((visit(name) for name in timings), key=lambda item: item[0], default=(0.0, []))
+
+
+def add_arguments(parser):
+    parser.add_argument('root_dir', help='Results root, e.g. completed_logs_big')
+    parser.add_argument('--overleaf-dir', help='Export destination (default overleaf/<root_dir>)')
+    parser.add_argument('--workers', type=int, help='Number of tasks run at once (default: CPU count)')
+    parser.add_argument('--svg', choices=SVG_PROFILES, default='default', help='SVG output profile of the rendered plots')
+
+
+def run(args):
+    root_dir = args.root_dir.rstrip('/')
+    overleaf_dir = args.overleaf_dir or os.path.join('overleaf', root_dir)
+
+    tasks = build_tasks(root_dir, overleaf_dir, args.svg)
+    start = time.time()
+    timings, failed = run_dag(tasks, args.workers)
+    wall = time.time() - start
+
+    length, chain = critical_path(tasks, timings)
+    print(f"Wall time: {wall:.2f}s")
+    print(f"Critical path: {length:.2f}s ({' -> '.join(chain)})")
+    if failed:
+        print(f"Failed or skipped: {', '.join(sorted(failed))}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.stats as sps
+
+from dataloader import load_archive
+
+HELP = 'Plan how many more iterations every configuration cell needs'
+
+# A cell is one configuration of one branch on one machine; the simulator is
+# rerun per cell, so the run list names everything needed to launch it again
+CELL_KEYS = ['Run_Type', 'Location', 'Folder', 'branch', 'Worker_Thread_Count', 'State_Save_Period']
+# Branches are told apart within the same configuration
+CONFIG_KEYS = ['Run_Type', 'Location', 'Folder', 'Worker_Thread_Count', 'State_Save_Period']
+LAUNCH_COLUMNS = ['Model', 'Model_Command', 'Max_Simulation_Time', 'Schedule_Queue_Type', 'Schedule_Queue_Count',
+                  'GVT_Method']
+RUNTIME = 'Simulation_Runtime_(secs.)'
+# Iterations per cell of the fixed design the planner replaces
+FIXED_ITERATIONS = 5
+
+
+def cell_stats(df, metric):
+    values = df[metric].astype('float64')
+    groups = [df[key] for key in CELL_KEYS]
+    stats = values.groupby(groups, observed=True).agg(['count', 'mean', 'std'])
+    launch = df[[col for col in LAUNCH_COLUMNS if col in df.columns]].groupby(groups, observed=True).first()
+    runtime = df[RUNTIME].astype('float64').groupby(groups, observed=True).mean().rename('Runtime')
+    return stats.join(launch).join(runtime)
+
+
+def runs_for_half_width(std, half_width, alpha, min_runs, max_runs):
+    # Smallest n in [min_runs, max_runs] with t(1 - alpha/2, n - 1) * std /
+    # sqrt(n) <= half_width, searched directly over every candidate n for all
+    # cells at once; cells that never reach the target get max_runs
+    candidates = np.arange(max(min_runs, 2), max_runs + 1)
+    factor = sps.t.ppf(1 - alpha / 2, candidates - 1) / np.sqrt(candidates)
+    std = np.asarray(std, dtype='float64')
+    half_width = np.broadcast_to(np.asarray(half_width, dtype='float64'), std.shape)
+    with np.errstate(invalid='ignore'):
+        reached = factor[None, :] * std[:, None] <= half_width[:, None]
+    n = candidates[reached.argmax(axis=1)]
+    return np.where(reached.any(axis=1), n, max_runs).astype('float64')
+
+
+def runs_to_separate(stats, baseline, alpha, power, min_effect, min_runs, max_runs):
+    # Iterations per branch for a two-sided Welch test at level alpha to detect
+    # the observed difference to the baseline branch of the same configuration
+    # with the given power: n = (z(1 - alpha/2) + z(power))^2 (s1^2 + s2^2) / d^2.
+    # Differences below min_effect of the baseline mean are not worth telling
+    # apart and add no iterations. The baseline needs the largest n of its comparisons
+    cells = stats.reset_index()
+    base = cells[cells['branch'] == baseline][CONFIG_KEYS + ['mean', 'std']]
+    pairs = cells.merge(base, on=CONFIG_KEYS, suffixes=('', '_base'))
+    pairs = pairs[(pairs['branch'] != baseline) &
+                  ((pairs['mean'] - pairs['mean_base']).abs() >= min_effect * pairs['mean_base'].abs())]
+    z = sps.norm.ppf(1 - alpha / 2) + sps.norm.ppf(power)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.ceil(z ** 2 * (pairs['std'] ** 2 + pairs['std_base'] ** 2) / (pairs['mean'] - pairs['mean_base']) ** 2)
+    pairs['Separate'] = np.clip(np.nan_to_num(n, nan=max_runs, posinf=max_runs), min_runs, max_runs)
+
+    needed = pairs.set_index(CELL_KEYS)['Separate']
+    base_needed = pairs.groupby(CONFIG_KEYS, observed=True)['Separate'].max().reset_index()
+    base_needed['branch'] = baseline
+    needed = pd.concat([needed, base_needed.set_index(CELL_KEYS)['Separate']])
+    return needed.reindex(stats.index)
+
+
+def plan(stats, alpha, half_width=None, relative=None, baseline=None, power=0.8, min_effect=0.01,
+         min_runs=2, max_runs=50):
+    cells = stats.copy()
+    target = half_width if half_width is not None else relative * cells['mean'].abs()
+    cells['Half_Width'] = sps.t.ppf(1 - alpha / 2, cells['count'] - 1) * cells['std'] / np.sqrt(cells['count'])
+    # Cells with a single iteration have no variance yet and get min_runs
+    cells['Required'] = runs_for_half_width(cells['std'].to_numpy(), np.asarray(target), alpha, min_runs, max_runs)
+    cells.loc[cells['count'] < 2, 'Required'] = min_runs
+    if baseline is not None:
+        separate = runs_to_separate(cells, baseline, alpha, power, min_effect, min_runs, max_runs)
+        cells['Required'] = np.fmax(cells['Required'], separate.to_numpy())
+    cells['Required'] = cells['Required'].astype('int64')
+    cells['Additional_Runs'] = (cells['Required'] - cells['count']).clip(lower=0)
+    cells['Cost_(secs.)'] = cells['Additional_Runs'] * cells['Runtime']
+    return cells
+
+
+def write_run_list(plan, path):
+    # One line per cell that needs more iterations, most expensive first
+    runs = plan[plan['Additional_Runs'] > 0].reset_index()
+    columns = CELL_KEYS + [col for col in LAUNCH_COLUMNS if col in runs.columns] + ['Additional_Runs', 'Cost_(secs.)']
+    runs = runs.sort_values('Cost_(secs.)', ascending=False)[columns]
+    runs.to_csv(path, index=False)
+    return runs
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('--model', help='Only plan model directories containing this keyword')
+    parser.add_argument('--latest', action='store_true', help='Only use the newest run directory of every run type')
+    parser.add_argument('--metric', default=RUNTIME, help=f'Metric whose variance is planned for (default {RUNTIME})')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--half-width', type=float, help='Target CI half-width in units of the metric')
+    target.add_argument('--relative', type=float, default=0.02,
+                        help='Target CI half-width as a fraction of the cell mean (default 0.02)')
+    parser.add_argument('--baseline', help='Also plan enough iterations to tell every branch apart from this one')
+    parser.add_argument('--min-effect', type=float, default=0.01,
+                        help='Smallest difference to the baseline, as a fraction of its mean, worth telling apart (default 0.01)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='Significance level (default 0.05)')
+    parser.add_argument('--power', type=float, default=0.8, help='Power of the branch comparison (default 0.8)')
+    parser.add_argument('--min-runs', type=int, default=2, help='Fewest iterations of any cell (default 2)')
+    parser.add_argument('--max-runs', type=int, default=50, help='Most iterations of any cell (default 50)')
+
+
+def run(args):
+    df = load_archive(args.directory, args.model, set(CELL_KEYS + LAUNCH_COLUMNS + [args.metric, RUNTIME])
+                      - {'Run_Type', 'Location'}, latest=args.latest)
+    if df is None:
+        return
+
+    relative = None if args.half_width is not None else args.relative
+    result = plan(cell_stats(df, args.metric), args.alpha, args.half_width, relative, args.baseline,
+                  args.power, args.min_effect, args.min_runs, args.max_runs)
+
+    output_dir = os.path.join(args.directory, 'Plan')
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'plan_data.txt'), 'w') as f:
+        f.write(f"Iterations per cell for {args.metric}\n\n")
+        f.write(result.drop(columns=[col for col in LAUNCH_COLUMNS if col in result.columns]).reset_index()
+                .to_string(index=False))
+        f.write("\n")
+    runs = write_run_list(result, os.path.join(output_dir, 'run_list.csv'))
+
+    # Iterations the fixed design spends beyond what quiet cells need
+    surplus = (FIXED_ITERATIONS - result['Required']).clip(lower=0)
+    print(f"{len(runs)} of {len(result)} cells need {int(result['Additional_Runs'].sum())} more runs "
+          f"({result['Cost_(secs.)'].sum():.0f} s of simulation)")
+    print(f"{int((surplus > 0).sum())} cells need fewer than {FIXED_ITERATIONS} iterations, saving "
+          f"{int(surplus.sum())} runs ({(surplus * result['Runtime']).sum():.0f} s) of a fixed design")
+    print(f"Saved run list to {os.path.join(output_dir, 'run_list.csv')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
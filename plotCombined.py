@@ -5,6 +5,7 @@ import os, sys
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
+from topk import top_k_threshold
 
 ###### Settings go here ######
 
@@ -63,9 +64,11 @@ def plotBar(dirPath):
     if plotDetails['sorted']:
         df.sort(yName, inplace=True, ascending=False, kind='quicksort')
 
-    # Retain only the top x% of data
+    # Retain only the top x% of data; the cut-off is the k-th largest value,
+    # found by partial selection instead of a full quantile sort
     quantVal = plotDetails['quantile']
-    threshold = df[yName].quantile(quantVal)
+    keep = int(np.ceil(len(df) * (1 - quantVal)))
+    threshold = top_k_threshold(df[yName], keep)
     df = df[df[yName] >= threshold]
 
     # Build the bar plot
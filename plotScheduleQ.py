@@ -14,6 +14,9 @@ import itertools, operator
 import subprocess
 import Gnuplot
 import Gnuplot.funcutils
+from decimate import decimate_indices
+from dataloader import find_result, read_results
+from derived import SEQUENTIAL_RUNTIME, add_derived
 
 ###### Settings go here ######
 
@@ -65,6 +68,11 @@ metricList      =   [
 
 rawDataFileName = 'scheduleq'
 
+# Level of detail for the yerrorlines: None draws every aggregated point,
+# otherwise each line is decimated to at most maxPoints ('lttb' or 'minmax')
+maxPoints       = None
+lodMethod       = 'lttb'
+
 statType        = [ 'Mean',
                     'CI_Lower',
                     'CI_Upper',
@@ -162,8 +170,11 @@ def plot(data, fileName, title, subtitle, xaxisLabel, yaxisLabel, ystart, yend,
     g('set output "' + fileName + '"')
     d = []
     for key in sorted(data[statType[0]]):
-        result = Gnuplot.Data(  data['header'][key],data[statType[0]][key],\
-                                data[statType[1]][key],data[statType[2]][key],\
+        columns = [data['header'][key], data[statType[0]][key], data[statType[1]][key], data[statType[2]][key]]
+        if maxPoints:
+            keep = decimate_indices([float(v) for v in columns[0]], [float(v) for v in columns[1]], maxPoints, lodMethod)
+            columns = [[column[i] for i in keep] for column in columns]
+        result = Gnuplot.Data(  columns[0],columns[1],columns[2],columns[3],\
                                 with_="yerrorlines",title=linePreface+key   )
         d.append(result)
     g.plot(*d)
@@ -226,31 +237,18 @@ def plot_stats(dirPath, fileName, xaxisLabel, keyLabel, filterLabel, filterValue
 
 def calc_and_plot(dirPath):
 
-    # Load the sequential simulation time
-    # seqFile = dirPath + 'sequential.dat'
-    # if not os.path.exists(seqFile):
-    #     print('Sequential data not available')
-    #     sys.exit()
-    # seqFp = open(seqFile, 'r')
-    # seqCount, _, seqTime = seqFp.readline().split()
-    # seqFp.close()
-
-    # Load data from csv file
-    inFile = dirPath + rawDataFileName + '.csv'
-    if not os.path.exists(inFile):
+    # Load data from csv file (or its compressed .csv.gz, .csv.zst, ... variant)
+    inFile = find_result(dirPath, rawDataFileName)
+    if inFile is None:
         print(rawDataFileName.upper() + ' raw data not available')
         sys.exit()
 
-    data = pd.read_csv(inFile, sep=',')
+    # The sequential simulation time is picked up from sequential.dat
+    data = read_results(inFile)
+    if SEQUENTIAL_RUNTIME not in data.columns:
+        print('Sequential data not available')
 
-    data['Event_Commitment_Ratio'] = \
-            data['Events_Processed'] / data['Events_Committed']
-    data['Total_Rollbacks'] = \
-            data['Primary_Rollbacks'] + data['Secondary_Rollbacks']
-    data['Event_Processing_Rate_(per_sec)'] = \
-            data['Events_Processed'] / data['Simulation_Runtime_(secs.)']
-    data['Speedup_w.r.t._Sequential_Simulation'] = \
-            float(seqTime) / data['Simulation_Runtime_(secs.)']
+    add_derived(data, [param['name'] for param in metricList])
 
     # Create the plots directory (if needed)
     outDir = dirPath + 'plots/'
@@ -0,0 +1,168 @@
+import ast
+import hashlib
+import operator
+import os
+import re
+
+# Declarative plot specs.
+#
+# A spec file (TOML or YAML) holds a list of plot configs using the same keys
+# as the hard-coded `plot_configs`/`configs` lists in the plotting scripts,
+# plus optional `filters` and `model` keys:
+#
+#   [[plot]]
+#   title   = "Branch vs Simulation Time"
+#   type    = "bar"
+#   groupby = ["Folder", "State_Save_Period"]
+#   x       = "branch"
+#   y       = "Simulation_Runtime_(secs.)"
+#   agg     = "mean"
+#   model   = "epidemic"
+#   filters = ["Simulation_Runtime_(secs.) >= 5",
+#              { column = "Worker_Thread_Count", op = "in", value = [3, 6] }]
+#
+# Filters and the referenced columns are handed to the loader so rows and
+# columns a plot does not need are dropped while the CSV is being read.
+#
+# A config may instead take its rows from an SQL query over the archive
+# database of `plotthesis query` (see query.py); filters and model do not
+# apply then:
+#
+#   sql = "SELECT * FROM runs WHERE Model = 'epidemic' AND Location = 'remote'"
+
+FILTER_OPS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda series, value: series.isin(value),
+    'not in': lambda series, value: ~series.isin(value),
+}
+
+# Column names never contain spaces, so the first token is always the column
+FILTER_PATTERN = re.compile(r'^\s*(?P<column>\S+)\s+(?P<op>==|!=|<=|>=|<|>|not in|in)\s+(?P<value>.+?)\s*$')
+
+# Keys of a plot config whose values name dataframe columns
+COLUMN_KEYS = ['groupby', 'x', 'y']
+
+
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text.strip('"\'')
+
+
+def parse_filter(spec):
+    if isinstance(spec, dict):
+        column, op, value = spec['column'], spec.get('op', '=='), spec['value']
+    elif isinstance(spec, (list, tuple)):
+        column, op, value = spec
+    else:
+        match = FILTER_PATTERN.match(spec)
+        if not match:
+            raise ValueError(f"Invalid filter expression: {spec!r}")
+        column, op, value = match.group('column'), match.group('op'), parse_value(match.group('value'))
+
+    if op not in FILTER_OPS:
+        raise ValueError(f"Unsupported filter operator {op!r} in {spec!r}")
+    if op in ('in', 'not in') and not isinstance(value, (list, tuple, set)):
+        value = [value]
+    return column, op, value
+
+
+def parse_filters(specs):
+    if not specs:
+        return []
+    if isinstance(specs, (str, dict)):
+        specs = [specs]
+    return [parse_filter(spec) for spec in specs]
+
+
+def apply_filters(df, filters):
+    # Combine every predicate into one boolean mask so the frame is copied once.
+    # A filter on a column the frame lacks is an error rather than a no-op, so
+    # a misspelt column never silently keeps every row
+    if not filters:
+        return df
+    mask = None
+    for column, op, value in parse_filters(filters):
+        if column not in df.columns:
+            raise ValueError(f"Filter column {column!r} not found in the data")
+        condition = FILTER_OPS[op](df[column], value)
+        mask = condition if mask is None else mask & condition
+    return df if mask is None else df[mask]
+
+
+def filter_columns(filters):
+    return {column for column, _, _ in parse_filters(filters)}
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def config_columns(config):
+    columns = set()
+    for key in COLUMN_KEYS:
+        columns.update(as_list(config.get(key)))
+    columns.update(filter_columns(config.get('filters')))
+    return columns
+
+
+def load_spec(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            spec = tomllib.load(f)
+    elif ext in ('.yaml', '.yml'):
+        import yaml
+        with open(path, 'r') as f:
+            spec = yaml.safe_load(f)
+    else:
+        raise ValueError(f"Unsupported plot spec format '{ext}' (expected .toml, .yaml or .yml)")
+
+    if isinstance(spec, dict):
+        spec = spec.get('plot', spec.get('plots', []))
+
+    configs = []
+    for config in spec:
+        config = dict(config)
+        # Validate filters up front so a typo fails before any data is read
+        parse_filters(config.get('filters'))
+        configs.append(config)
+    return configs
+
+
+def group_name(filters, model):
+    # Short file-name tag of a filter group: the model keyword and a digest of
+    # the filters, 'all' for the unfiltered group
+    parts = [str(model)] if model else []
+    if filters:
+        parts.append(hashlib.md5(repr(parse_filters(filters)).encode()).hexdigest()[:8])
+    return '_'.join(parts) or 'all'
+
+
+def group_configs(configs):
+    # Configs sharing the same filters and model keyword can be served by a
+    # single read projected onto the union of the columns they reference
+    groups = {}
+    for config in configs:
+        key = (repr(parse_filters(config.get('filters'))), repr(config.get('model')))
+        if key not in groups:
+            groups[key] = {'filters': config.get('filters'), 'model': config.get('model'),
+                           'name': group_name(config.get('filters'), config.get('model')),
+                           'columns': set(), 'configs': []}
+        groups[key]['columns'].update(config_columns(config))
+        groups[key]['configs'].append(config)
+    return list(groups.values())
@@ -0,0 +1,45 @@
+import argparse
+
+import attribution
+import compress
+import explorer
+import farm
+import pareto
+import parselogs
+import pipeline
+import planner
+import query
+import scaling
+import trend
+
+# Analysis subcommands; every module provides HELP, add_arguments(parser) and
+# run(args) and can also be executed on its own
+COMMANDS = {
+    'scaling': scaling,
+    'pareto': pareto,
+    'pipeline': pipeline,
+    'trend': trend,
+    'farm': farm,
+    'query': query,
+    'explore': explorer,
+    'compress': compress,
+    'plan': planner,
+    'attribute': attribution,
+    'parse': parselogs,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis commands over a results archive')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, module in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=module.HELP, description=module.HELP)
+        module.add_arguments(subparser)
+        subparser.set_defaults(run=module.run)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
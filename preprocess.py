@@ -0,0 +1,89 @@
+import pandas as pd
+
+# Shared preprocessing of raw iterations before they are aggregated.
+#
+# Configs enable it with a "preprocess" table, e.g.
+#
+#   "preprocess": {"keep_last": 4, "outliers": "mad", "k": 3.0}
+#
+#   keep_first   keep only the first N iterations of every group
+#   keep_last    keep only the last N iterations (drops warm-up runs)
+#   outliers     "mad" (|x - median| > k * 1.4826 * MAD, default k 3) or
+#                "iqr" (outside [Q1 - k * IQR, Q3 + k * IQR], default k 1.5)
+#
+# Iterations are grouped by the columns the plot aggregates over and every step
+# is a grouped vectorized transform. The number of rows dropped from every group
+# is reported. Cuts that look at one row at a time, such as a minimum runtime,
+# belong in the config's "filters", which the loader applies while reading.
+
+DEFAULT_K = {'mad': 3.0, 'iqr': 1.5}
+MAD_SCALE = 1.4826
+OPTIONS = ['keep_first', 'keep_last', 'outliers', 'k']
+
+
+def step_names(options):
+    # The steps an options table enables, all of which need every iteration of a group
+    return [key for key in (options or {}) if key != 'k']
+
+
+def outlier_mask(df, keys, column, method, k):
+    values = df[column].astype('float64')
+    grouped = values.groupby(keys, dropna=False)
+    if method == 'mad':
+        deviation = (values - grouped.transform('median')).abs()
+        scale = MAD_SCALE * deviation.groupby(keys, dropna=False).transform('median')
+        return (deviation <= k * scale) | (scale == 0) | values.isna()
+    if method == 'iqr':
+        q1 = grouped.transform('quantile', 0.25)
+        q3 = grouped.transform('quantile', 0.75)
+        spread = k * (q3 - q1)
+        return values.between(q1 - spread, q3 + spread) | values.isna()
+    raise ValueError(f"Unknown outlier method '{method}' (expected 'mad' or 'iqr')")
+
+
+def group_keys(df, group_cols):
+    return [df[col] for col in group_cols] if group_cols else [pd.Series(0, index=df.index)]
+
+
+def preprocess(df, group_cols, value_cols, options, label=''):
+    if not options or df.empty:
+        return df
+
+    unknown = [key for key in options if key not in OPTIONS]
+    if unknown:
+        raise ValueError(f"Unknown preprocess options {unknown} (expected {OPTIONS}); "
+                         f"row-level cuts such as a minimum runtime go into 'filters'")
+    group_cols = [col for col in group_cols if col in df.columns]
+    if isinstance(value_cols, str):
+        value_cols = [value_cols]
+    before = df.groupby(group_keys(df, group_cols), dropna=False).size()
+
+    if options.get('keep_first'):
+        df = df[df.groupby(group_keys(df, group_cols), dropna=False).cumcount() < options['keep_first']]
+    if options.get('keep_last'):
+        df = df[df.groupby(group_keys(df, group_cols), dropna=False).cumcount(ascending=False) < options['keep_last']]
+
+    method = options.get('outliers')
+    if method:
+        k = options.get('k', DEFAULT_K.get(method))
+        keys = group_keys(df, group_cols)
+        mask = pd.Series(True, index=df.index)
+        for column in value_cols:
+            mask &= outlier_mask(df, keys, column, method, k)
+        df = df[mask]
+
+    after = df.groupby(group_keys(df, group_cols), dropna=False).size()
+    dropped = before.subtract(after.reindex(before.index, fill_value=0))
+    report_dropped(dropped[dropped > 0], label)
+    return df
+
+
+def report_dropped(dropped, label=''):
+    prefix = f"{label}: " if label else ''
+    if dropped.empty:
+        print(f"{prefix}Preprocessing dropped no rows")
+        return
+    print(f"{prefix}Preprocessing dropped {int(dropped.sum())} rows:")
+    for group, count in dropped.items():
+        group = group if isinstance(group, tuple) else (group,)
+        print(f"  {', '.join(str(value) for value in group)}: {int(count)}")
@@ -0,0 +1,132 @@
+import argparse
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from dataloader import iter_archive, load_archive
+from derived import dataset_version
+
+HELP = 'Run SQL over the result archive'
+
+# The archive is loaded once (deduplicated, with the parsed run columns) into
+# a `runs` table of an embedded database kept in the results root, and rebuilt
+# only when a result CSV is added, removed or changed. DuckDB is used when it is
+# installed, SQLite otherwise. Column names with punctuation must be quoted,
+# e.g. SELECT branch, AVG("Simulation_Runtime_(secs.)") FROM runs GROUP BY branch
+ENGINES = ['sqlite', 'duckdb']
+DATABASE_FILES = {'sqlite': '.results.sqlite', 'duckdb': '.results.duckdb'}
+TABLE = 'runs'
+INDEXED_COLUMNS = ['branch', 'Model', 'Folder', 'Run_Type', 'Worker_Thread_Count']
+
+
+def default_engine():
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return 'sqlite'
+    return 'duckdb'
+
+
+def connect(path, engine):
+    if engine == 'duckdb':
+        import duckdb
+        return duckdb.connect(path)
+    return sqlite3.connect(path)
+
+
+def archive_version(root_dir):
+    return dataset_version([csv_file for _, _, csv_file in iter_archive(root_dir)])
+
+
+def stored_version(con):
+    try:
+        return con.execute("SELECT version FROM meta").fetchone()[0]
+    except Exception:
+        return None
+
+
+def build(con, engine, root_dir, version):
+    df = load_archive(root_dir)
+    if df is None:
+        raise SystemExit(f"No result CSVs found below {root_dir}")
+    df.attrs = {}
+    # Categories become text and timestamps ISO strings, which both engines order correctly
+    df = df.astype({col: 'object' for col in df.select_dtypes('category').columns})
+    df['Timestamp'] = df['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    con.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    con.execute("DROP TABLE IF EXISTS meta")
+    if engine == 'duckdb':
+        con.register('archive', df)
+        con.execute(f"CREATE TABLE {TABLE} AS SELECT * FROM archive")
+        con.unregister('archive')
+    else:
+        df.to_sql(TABLE, con, index=False)
+    for column in INDEXED_COLUMNS:
+        if column in df.columns:
+            con.execute(f'CREATE INDEX "idx_{column}" ON {TABLE} ("{column}")')
+    con.execute("CREATE TABLE meta (version TEXT)")
+    con.execute("INSERT INTO meta VALUES (?)", [version])
+    con.commit()
+    print(f"Indexed {len(df)} runs into {TABLE}")
+
+
+def open_database(root_dir, engine=None, rebuild=False):
+    # Connection to the archive database, (re)built when it is missing or stale
+    engine = engine or default_engine()
+    con = connect(os.path.join(root_dir, DATABASE_FILES[engine]), engine)
+    version = archive_version(root_dir)
+    if rebuild or stored_version(con) != version:
+        build(con, engine, root_dir, version)
+    return con
+
+
+def run_query(con, sql, params=None):
+    # `?` placeholders in sql are bound to params with either engine
+    if isinstance(con, sqlite3.Connection):
+        return pd.read_sql_query(sql, con, params=params)
+    return con.execute(sql, params or []).df()
+
+
+def sql_frame(root_dir, sql, engine=None):
+    # Rows of a plot config whose data source is an SQL query
+    con = open_database(root_dir, engine)
+    try:
+        return run_query(con, sql)
+    finally:
+        con.close()
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('sql', help=f'Query over the {TABLE} table')
+    parser.add_argument('--engine', choices=ENGINES, help='Database engine (default: duckdb if installed, else sqlite)')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the database even if the archive is unchanged')
+    parser.add_argument('--output', help='Also write the result to this CSV file')
+
+
+def run(args):
+    con = open_database(args.directory, args.engine, args.rebuild)
+    start = time.perf_counter()
+    result = run_query(con, args.sql)
+    elapsed = (time.perf_counter() - start) * 1000
+    con.close()
+
+    with pd.option_context('display.max_rows', None, 'display.width', None):
+        print(result.to_string(index=False))
+    print(f"{len(result)} rows in {elapsed:.1f} ms")
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"Saved result to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
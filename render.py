@@ -0,0 +1,118 @@
+import gzip
+import io
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib as mpl
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Figures are built directly on matplotlib.figure.Figure with their own canvas
+# instead of through pyplot, so no figure manager, current figure or rcParams
+# is shared between them. Styles are applied to the axes of each figure, which
+# lets independent figures be drawn concurrently from a thread pool that
+# shares the loaded DataFrames.
+
+# seaborn's "deep" palette
+DEEP = ['#4c72b0', '#dd8452', '#55a868', '#c44e52', '#8172b3', '#937860', '#da8bc3', '#8c8c8c', '#ccb974', '#64b5cd']
+
+STYLES = {
+    # seaborn "whitegrid" with the "deep" palette
+    'whitegrid': {'facecolor': 'white', 'edgecolor': '0.8', 'grid': {'color': '0.8', 'linestyle': '-'},
+                  'palette': DEEP},
+    # Plain white axes with a faint grid, used for the top-performer histograms
+    'paper': {'facecolor': 'white', 'edgecolor': 'lightgray', 'grid': {'color': 'lightgray', 'alpha': 0.3}},
+}
+
+
+# SVG output profiles. 'lean' keeps text as <text> elements that reference the
+# font instead of embedding glyph paths, simplifies paths more aggressively,
+# drops the date from the metadata and rounds the coordinates in the markup;
+# 'svgz' also gzips the result into a .svgz file
+SVG_PROFILES = ['default', 'lean', 'svgz']
+LEAN_RC = {'svg.fonttype': 'none', 'path.simplify': True, 'path.simplify_threshold': 0.5}
+COORDINATE_DIGITS = 2
+TAG = re.compile(r'<[^>]+>')
+NUMBER = re.compile(r'-?\d+\.\d{%d,}' % (COORDINATE_DIGITS + 1))
+svg_profile = 'default'
+# rcParams are global, so the lean settings are only swapped in while holding
+# this lock; SVG saves of the lean profiles are serialized by it
+svg_lock = threading.Lock()
+
+
+def set_svg_profile(profile):
+    # Called once before anything is rendered; only selects the profile, the
+    # rcParams of the lean profiles are applied by save_figure
+    global svg_profile
+    svg_profile = profile
+
+
+def round_coordinates(svg):
+    # Numbers inside tags only, so text content is never touched
+    rounded = lambda number: f"{float(number.group(0)):.{COORDINATE_DIGITS}f}"
+    return TAG.sub(lambda tag: NUMBER.sub(rounded, tag.group(0)), svg)
+
+
+def save_figure(fig, filepath, **kwargs):
+    # Save through the active SVG profile and return the path written, which
+    # ends in .svgz with the svgz profile. Other formats are saved unchanged
+    if svg_profile == 'default' or not filepath.endswith('.svg'):
+        fig.savefig(filepath, **kwargs)
+        return filepath
+
+    # The figure is also rendered as the default profile would save it, which
+    # is what the saving is reported against
+    default, lean = io.BytesIO(), io.BytesIO()
+    with svg_lock:
+        fig.savefig(default, format='svg', **kwargs)
+        with mpl.rc_context(LEAN_RC):
+            fig.savefig(lean, format='svg', metadata={'Date': None}, **kwargs)
+    data = round_coordinates(lean.getvalue().decode('utf-8')).encode('utf-8')
+    if svg_profile == 'svgz':
+        filepath += 'z'
+        data = gzip.compress(data, mtime=0)
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    size = len(default.getvalue())
+    print(f"{filepath}: {len(data)} bytes, {size - len(data)} bytes ({1 - len(data) / size:.0%}) "
+          f"smaller than the default SVG")
+    return filepath
+
+
+def style_axes(ax, style):
+    style = STYLES[style] if isinstance(style, str) else style
+    if not style:
+        return
+    ax.set_facecolor(style['facecolor'])
+    for spine in ax.spines.values():
+        spine.set_edgecolor(style['edgecolor'])
+    if 'grid' in style:
+        ax.grid(True, **style['grid'])
+        ax.set_axisbelow(True)
+    if 'palette' in style:
+        ax.set_prop_cycle(color=style['palette'])
+
+
+def new_figure(figsize, nrows=1, ncols=1, style=None, **subplot_kw):
+    # Same return values as plt.subplots
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows, ncols, **subplot_kw)
+    for ax in np.ravel(axes):
+        style_axes(ax, style)
+    return fig, axes
+
+
+def render_all(tasks, workers=None):
+    # Run zero-argument rendering callables on a thread pool; the first error
+    # is raised once every task has finished
+    if workers == 1:
+        for task in tasks:
+            task()
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(task) for task in tasks]
+    for future in futures:
+        future.result()
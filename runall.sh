@@ -1,37 +1,4 @@
 #!/bin/bash
-./deletePlot.sh $1
-# # Base command
-# base_cmd="python customPlot.py"
-
-# # Directory pattern
-# dir_pattern="$1/*/*/"
-
-# # Find all matching directories and execute the Python script
-# for dir in $dir_pattern; do
-#     if [ -d "$dir" ]; then
-#         echo "Executing in directory: $dir"
-#         $base_cmd "$dir"
-#         echo "------------------------"
-#     fi
-# done
-
-base_cmd2="python customGraphs.py"
-
-dir_pat="$1/*"
-
-for dir in $dir_pat; do
-    if [ -d "$dir" ]; then
-        echo "executing dir $dir" 
-        $base_cmd2 "$dir/*"
-        echo "------------------------"
-    fi
-done
-
-python customHistograms.py $1
-
-sleep 5
-
-python generateLatex.py $1
-
-rm -rf overleaf/$1
-python migrate_foroverleaf.py $1 overleaf/$1
\ No newline at end of file
+# Runs delete, per run type plots, histograms, LaTeX and the Overleaf export
+# as a task graph; independent steps run concurrently (see pipeline.py)
+python "$(dirname "$0")/pipeline.py" "$@"
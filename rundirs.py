@@ -0,0 +1,54 @@
+import re
+
+import pandas as pd
+
+# Run directories are named <run type>[_local|local]_<YYYYmmddHHMMSS>, e.g.
+# SIMD_20240715105337, SIMD_local_20240715140737 or fossillocal_20240714170200.
+# Directories without a timestamp (SIMDoptiplex) are kept as their own run type.
+TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+TIMESTAMP_PATTERN = re.compile(r'_\d{14}(?=$|[\\/])')
+RUN_DIR_PATTERN = r'^(?P<Run_Type>.*?)(?:_?(?P<Location>local))?(?:_(?P<Timestamp>\d{14}))?$'
+RUN_COLUMNS = ['Run_Type', 'Location', 'Timestamp']
+
+
+def remove_timestamp(path):
+    # Strip the timestamp of every component, so 'SIMD_20240715105337/pcs-10k'
+    # becomes 'SIMD/pcs-10k'
+    return TIMESTAMP_PATTERN.sub('', path)
+
+
+def parse_run_dirs(names):
+    # Parse run directory names in one vectorized pass into a frame indexed by
+    # name with categorical Run_Type and Location ('local' or 'remote') and a
+    # datetime Timestamp (NaT when the name carries none)
+    names = pd.Index(pd.unique(pd.Series(names, dtype='object')), name='Run_Dir')
+    parsed = names.to_series().str.extract(RUN_DIR_PATTERN)
+    parsed['Run_Type'] = parsed['Run_Type'].astype('category')
+    parsed['Location'] = parsed['Location'].fillna('remote').astype(pd.CategoricalDtype(['remote', 'local']))
+    parsed['Timestamp'] = pd.to_datetime(parsed['Timestamp'], format=TIMESTAMP_FORMAT)
+    return parsed
+
+
+def add_run_columns(df, column='Run_Dir'):
+    # Add the parsed run columns to a frame holding the run directory of every
+    # row; every distinct directory is parsed once
+    run_dirs = df[column].astype('category')
+    parsed = parse_run_dirs(run_dirs.cat.categories)
+    codes = run_dirs.cat.codes.to_numpy()
+    columns = {column: run_dirs}
+    for name in RUN_COLUMNS:
+        values = parsed[name].to_numpy()
+        columns[name] = pd.Series(values[codes], index=df.index).astype(parsed[name].dtype)
+    return df.assign(**columns)
+
+
+def latest_run_dirs(names):
+    # Names of the newest directory of every (run type, location); directories
+    # without a timestamp are always kept
+    parsed = parse_run_dirs(names)
+    undated = parsed['Timestamp'].isna()
+    newest = parsed[~undated].groupby(['Run_Type', 'Location'], observed=True)['Timestamp'].transform('max')
+    keep = undated.copy()
+    keep[~undated] = parsed.loc[~undated, 'Timestamp'] == newest
+    return list(parsed.index[keep])
+
@@ -0,0 +1,179 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.stats as sps
+
+from dataloader import load_archive
+from render import SVG_PROFILES, new_figure, save_figure, set_svg_profile
+from derived import SEQUENTIAL_RUNTIME
+
+HELP = 'Strong-scaling analysis over Worker_Thread_Count'
+
+# Every (run type, model, branch, GVT method, state save period) is one
+# scaling curve; the thread count is its x axis
+SCALING_KEYS = ['path', 'Folder', 'branch', 'GVT_Method', 'State_Save_Period']
+THREADS = 'Worker_Thread_Count'
+RUNTIME = 'Simulation_Runtime_(secs.)'
+EVENTS = 'Events_Processed'
+COLUMNS = ['branch', 'GVT_Method', 'State_Save_Period', THREADS, RUNTIME, EVENTS, SEQUENTIAL_RUNTIME]
+
+METRICS = ['Speedup', 'Efficiency', 'Karp_Flatt_Serial_Fraction', 'Events_per_sec_per_Thread']
+
+
+def per_run_metrics(df, keys):
+    # Scaling metrics for every raw iteration. The single-thread reference time is
+    # the sequential runtime from sequential.dat; curves without one fall back to
+    # p_min * T(p_min) of their smallest thread count
+    p = df[THREADS].astype('float64')
+    runtime = df[RUNTIME].astype('float64')
+    group = [df[key] for key in keys]
+
+    cell_mean = runtime.groupby(group + [df[THREADS]], dropna=False).transform('mean')
+    p_min = p.groupby(group, dropna=False).transform('min')
+    fallback = (cell_mean * p).where(p == p_min).groupby(group, dropna=False).transform('max')
+    reference = df[SEQUENTIAL_RUNTIME] if SEQUENTIAL_RUNTIME in df.columns else pd.Series(np.nan, index=df.index)
+    reference = reference.astype('float64').fillna(fallback)
+
+    df = df.copy()
+    df['Reference_Runtime'] = reference
+    df['Speedup'] = reference / runtime
+    df['Efficiency'] = df['Speedup'] / p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['Karp_Flatt_Serial_Fraction'] = ((1 / df['Speedup'] - 1 / p) / (1 - 1 / p)).where(p > 1)
+    df['Events_per_sec_per_Thread'] = df[EVENTS] / runtime / p
+    return df
+
+
+def summarize(df, keys, confidence=0.95):
+    # Mean and confidence interval of every metric per curve and thread count
+    stats = df.groupby(keys + [THREADS], dropna=False)[METRICS + [RUNTIME]].agg(['mean', 'sem', 'count'])
+    for metric in METRICS + [RUNTIME]:
+        count = stats[(metric, 'count')]
+        t_value = sps.t.ppf((1 + confidence) / 2., np.maximum(count - 1, 1))
+        stats[(metric, 'ci')] = (stats[(metric, 'sem')] * t_value).where(count > 1)
+    return stats.sort_index()
+
+
+def fit_amdahl(df, keys):
+    # Least-squares fit of T(p) = a + b / p on the raw iterations of every curve,
+    # solved in closed form from per-curve sums so all curves fit in one pass.
+    # a / (a + b) is the serial fraction of the fitted single-thread time
+    x = 1 / df[THREADS].astype('float64')
+    y = df[RUNTIME].astype('float64')
+    sums = pd.DataFrame({'n': 1, 'x': x, 'y': y, 'xx': x * x, 'xy': x * y})
+    sums = sums.groupby([df[key] for key in keys], dropna=False).sum()
+    sums['levels'] = x.groupby([df[key] for key in keys], dropna=False).nunique()
+
+    denominator = sums['n'] * sums['xx'] - sums['x'] ** 2
+    fit = pd.DataFrame(index=sums.index)
+    fit['b'] = ((sums['n'] * sums['xy'] - sums['x'] * sums['y']) / denominator).where(sums['levels'] > 1)
+    fit['a'] = (sums['y'] - fit['b'] * sums['x']) / sums['n']
+    fit['Serial_Fraction'] = fit['a'] / (fit['a'] + fit['b'])
+    fit['Reference_Runtime'] = df.groupby(keys, dropna=False)['Reference_Runtime'].mean()
+    return fit
+
+
+def flag_efficiency_drops(stats, keys, max_drop):
+    # A curve is flagged when its efficiency at the largest thread count has
+    # dropped by more than max_drop relative to its smallest thread count
+    efficiency = stats[('Efficiency', 'mean')].reset_index()
+    efficiency.columns = keys + [THREADS, 'Efficiency']
+    ordered = efficiency.sort_values(THREADS).groupby(keys, dropna=False)
+    flags = pd.DataFrame({
+        'Threads_Min': ordered[THREADS].first(),
+        'Threads_Max': ordered[THREADS].last(),
+        'Efficiency_Min_Threads': ordered['Efficiency'].first(),
+        'Efficiency_Max_Threads': ordered['Efficiency'].last(),
+    })
+    flags['Efficiency_Drop'] = 1 - flags['Efficiency_Max_Threads'] / flags['Efficiency_Min_Threads']
+    flags['Flagged'] = (flags['Threads_Max'] > flags['Threads_Min']) & (flags['Efficiency_Drop'] > max_drop)
+    return flags
+
+
+def plot_scaling(stats, fit, output_dir):
+    curve_keys = SCALING_KEYS[2:]
+    for (path, folder), run_stats in stats.groupby(level=['path', 'Folder'], sort=False):
+        fig, (ax_speedup, ax_efficiency) = new_figure((20, 8), 1, 2)
+
+        for curve, curve_stats in run_stats.groupby(level=curve_keys, sort=False):
+            label = ' / '.join(str(value) for value in curve)
+            threads = curve_stats.index.get_level_values(THREADS).to_numpy(dtype='float64')
+
+            line = ax_speedup.errorbar(threads, curve_stats[('Speedup', 'mean')], yerr=curve_stats[('Speedup', 'ci')],
+                                       marker='o', capsize=5, label=label)
+            ax_efficiency.errorbar(threads, curve_stats[('Efficiency', 'mean')], yerr=curve_stats[('Efficiency', 'ci')],
+                                   marker='o', capsize=5, label=label, color=line[0].get_color())
+
+            params = fit.loc[(path, folder) + tuple(curve)]
+            if len(threads) > 1 and not np.isnan(params['b']):
+                p = np.linspace(threads.min(), threads.max(), 50)
+                ax_speedup.plot(p, params['Reference_Runtime'] / (params['a'] + params['b'] / p), linestyle='--',
+                                color=line[0].get_color(), alpha=0.7)
+
+        ax_speedup.set_title('Speedup (dashed: Amdahl fit)', fontsize=16)
+        ax_speedup.set_ylabel('Speedup (C.I. = 95%)', fontsize=14)
+        ax_efficiency.set_title('Parallel Efficiency', fontsize=16)
+        ax_efficiency.set_ylabel('Efficiency (C.I. = 95%)', fontsize=14)
+        for ax in (ax_speedup, ax_efficiency):
+            ax.set_xlabel(THREADS, fontsize=14)
+            ax.grid(True, linestyle='--', alpha=0.7)
+        ax_efficiency.legend(title=' / '.join(curve_keys), bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=11)
+
+        fig.suptitle(f"Strong Scaling - {path} - {folder}", fontsize=20)
+        fig.tight_layout()
+        filepath = os.path.join(output_dir, f"Scaling_{path}_{folder}.svg")
+        filepath = save_figure(fig, filepath, dpi=300, bbox_inches='tight')
+        print(f"Saved plot to {filepath}")
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', help='Results root containing <run type>/<model>/scheduleq.csv')
+    parser.add_argument('--model', help='Only analyze model directories containing this keyword')
+    parser.add_argument('--svg', choices=SVG_PROFILES, default='default',
+                        help='SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)')
+    parser.add_argument('--latest', action='store_true', help='Only read the newest run directory of every run type')
+    parser.add_argument('--max-drop', type=float, default=0.2,
+                        help='Flag curves whose efficiency drops by more than this fraction (default 0.2)')
+
+
+def run(args):
+    set_svg_profile(args.svg)
+    df = load_archive(args.directory, args.model, COLUMNS, latest=args.latest)
+    if df is None:
+        return
+
+    output_dir = os.path.join(args.directory, 'Scaling')
+    os.makedirs(output_dir, exist_ok=True)
+
+    df = per_run_metrics(df, SCALING_KEYS)
+    stats = summarize(df, SCALING_KEYS)
+    fit = fit_amdahl(df, SCALING_KEYS)
+    flags = flag_efficiency_drops(stats, SCALING_KEYS, args.max_drop).join(fit)
+
+    with open(os.path.join(output_dir, 'scaling_data.txt'), 'w') as f:
+        f.write("Scaling statistics per curve and thread count\n\n")
+        f.write(stats.reset_index().to_string(index=False))
+        f.write("\n\nAmdahl fit and efficiency drop per curve\n\n")
+        f.write(flags.reset_index().to_string(index=False))
+        f.write("\n")
+
+    flagged = flags[flags['Flagged']]
+    if flagged.empty:
+        print("No efficiency drops above the threshold")
+    else:
+        print(f"Efficiency drops by more than {args.max_drop:.0%}:")
+        print(flagged[['Threads_Min', 'Threads_Max', 'Efficiency_Drop', 'Serial_Fraction']].to_string())
+
+    plot_scaling(stats, fit, output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
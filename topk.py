@@ -0,0 +1,23 @@
+import numpy as np
+
+# Top-N selection without sorting the whole table.
+
+
+def top_k(df, n, column, ascending=True):
+    # nsmallest/nlargest run a partial selection and return only the n rows, sorted
+    if ascending:
+        return df.nsmallest(n, column)
+    return df.nlargest(n, column)
+
+
+def top_k_threshold(values, k, largest=True):
+    # k-th largest (or smallest) value via argpartition, O(n) instead of a sort
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.nan
+    k = min(max(k, 1), len(values))
+    if largest:
+        return np.partition(values, len(values) - k)[len(values) - k]
+    return np.partition(values, k - 1)[k - 1]
+
@@ -0,0 +1,211 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.stats as sps
+
+from aggregates import PartialAggregate, pool_moments
+from dataloader import RunIndex, cache_path, iter_archive, read_bytes, read_parallel, read_results
+from rundirs import add_run_columns
+from render import SVG_PROFILES, new_figure, save_figure, set_svg_profile
+
+HELP = 'Trend of every branch and model across campaign timestamps'
+
+# A series is one branch of one model on one run type and location; its
+# campaigns are the timestamped run directories of that type
+SERIES_KEYS = ['Run_Type', 'Location', 'Folder', 'branch']
+RUNTIME = 'Simulation_Runtime_(secs.)'
+
+# Count, mean and M2 of the metric per branch of every result file, cached per
+# archive root next to the run index. An entry is reused while the file keeps
+# its size and mtime and the run index keeps the same rows of it (`mask`
+# digests the rows left after deduplication), so a repeated trend only reads
+# the files that are new or changed
+STATS_CACHE = 'campaign_stats.csv'
+STATS_KEYS = ['file', 'size', 'mtime', 'metric', 'mask']
+
+
+def read_stats_cache(root_dirs):
+    caches = [pd.read_csv(path, dtype={'file': str, 'metric': str, 'mask': str, 'branch': str})
+              for path in (cache_path(root_dir, STATS_CACHE) for root_dir in root_dirs) if os.path.exists(path)]
+    if not caches:
+        return {}
+    cache = pd.concat(caches, ignore_index=True)
+    return {key: rows.drop(columns=STATS_KEYS) for key, rows in cache.groupby(STATS_KEYS, sort=False)}
+
+
+def write_stats_cache(root_dirs, cache):
+    # Entries of files that no longer exist or changed are dropped
+    current = {}
+    for (csv_file, size, mtime, metric, mask), rows in cache.items():
+        if os.path.exists(csv_file):
+            stat = os.stat(csv_file)
+            if stat.st_size == size and stat.st_mtime_ns == mtime:
+                current[(csv_file, size, mtime, metric, mask)] = rows
+    for root_dir in root_dirs:
+        prefix = os.path.join(os.path.abspath(root_dir), '')
+        entries = [rows.assign(**dict(zip(STATS_KEYS, key))) for key, rows in current.items()
+                   if key[0].startswith(prefix)]
+        if entries:
+            path = cache_path(root_dir, STATS_CACHE)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pd.concat(entries, ignore_index=True)[STATS_KEYS + ['branch', 'count', 'mean', 'm2']].to_csv(path, index=False)
+
+
+def file_stats(df, metric):
+    # count, mean and M2 of metric per branch of one file's rows. A file
+    # without rows (every run a copy) gets one empty row without a branch, so
+    # it is still cached and adds nothing when pooled
+    if df.empty:
+        return pd.DataFrame({'branch': [np.nan], 'count': [0.0], 'mean': [np.nan], 'm2': [0.0]})
+    stats = PartialAggregate(['branch'], [metric]).fold(df).stats.droplevel(1, axis=1)
+    return stats.rename_axis('branch').reset_index().astype({'branch': str})
+
+
+def archive_stats(root_dirs, metric, model=None, workers=None):
+    # Per-file statistics of every result file below root_dirs, with the run
+    # directory and model directory of the file. Runs copied to another run
+    # directory or root are counted once, as with load_archive
+    index = RunIndex(root_dirs)
+    cache = read_stats_cache(root_dirs)
+    sources = [source for root_dir in root_dirs for source in iter_archive(root_dir, model)]
+    stats = {os.path.abspath(csv_file): os.stat(csv_file) for _, _, csv_file in sources}
+    cached_files = {key[0] for key in cache if key[3] == metric}
+
+    def read(source):
+        # Rows (with their row numbers) of files whose statistics are not
+        # cached; a file that is hashed for the first time is read only once
+        csv_file = source[2]
+        if os.path.abspath(csv_file) in cached_files and index.is_current(csv_file):
+            return None
+        data = None
+        if not index.is_current(csv_file):
+            data = read_bytes(csv_file)
+            index.hashes(csv_file, data)
+        return read_results(csv_file, ['branch', metric], row_ids=True, data=data)
+
+    partials = []
+    for (run_type, model_dir, csv_file), df in zip(sources, read_parallel(read, sources, workers)):
+        stat = stats[os.path.abspath(csv_file)]
+        keep = index.keep_mask(csv_file)
+        key = (os.path.abspath(csv_file), stat.st_size, stat.st_mtime_ns, metric,
+               hashlib.md5(np.packbits(keep).tobytes()).hexdigest())
+        if key not in cache:
+            if df is None:
+                df = read_results(csv_file, ['branch', metric], row_ids=True)
+            cache[key] = file_stats(index.deduplicate(df, csv_file), metric)
+        partials.append(cache[key].assign(Run_Dir=run_type, Folder=model_dir))
+    index.save()
+    write_stats_cache(root_dirs, cache)
+
+    if not partials:
+        return None
+    print(f"Summarized {len(partials)} CSV files")
+    return add_run_columns(pd.concat(partials, ignore_index=True))
+
+
+def campaign_stats(partials):
+    # Count, mean and standard deviation of every series per campaign, pooled
+    # from the per-file statistics; everything else works on these rows
+    dated = partials[partials['Timestamp'].notna()]
+    skipped = partials.loc[partials['Timestamp'].isna(), 'Run_Dir'].unique()
+    if len(skipped):
+        print(f"Skipping run directories without a timestamp: {', '.join(map(str, skipped))}")
+    stats = pool_moments(dated, SERIES_KEYS + ['Timestamp'])
+    stats['count'] = stats['count'].astype('int64')
+    stats['std'] = np.sqrt(stats['m2'] / (stats['count'] - 1))
+    stats['sem'] = stats['std'] / np.sqrt(stats['count'])
+    return stats[['count', 'mean', 'std', 'sem']].sort_index()
+
+
+def campaign_shifts(stats, alpha):
+    # Welch's t-test of every campaign against the previous campaign of the same
+    # series, vectorized over all campaigns from the summary statistics
+    previous = stats.groupby(level=SERIES_KEYS, observed=True).shift()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _, p_value = sps.ttest_ind_from_stats(*(frame[col].to_numpy(dtype='float64')
+                                                for frame in (stats, previous) for col in ('mean', 'std', 'count')),
+                                              equal_var=False)
+    shifts = stats.copy()
+    shifts['Previous_Mean'] = previous['mean']
+    shifts['Change'] = shifts['mean'] / previous['mean'] - 1
+    shifts['p_value'] = p_value
+    shifts['Significant'] = shifts['p_value'] < alpha
+    return shifts
+
+
+def plot_trend(shifts, metric, output_dir):
+    for (run_type, location, folder), series in shifts.groupby(level=['Run_Type', 'Location', 'Folder'],
+                                                               observed=True, sort=False):
+        fig, ax = new_figure((15, 8))
+        for branch, branch_stats in series.groupby(level='branch', observed=True, sort=False):
+            dates = branch_stats.index.get_level_values('Timestamp')
+            line = ax.errorbar(dates, branch_stats['mean'], yerr=branch_stats['sem'], marker='o', capsize=5,
+                               label=branch)
+            significant = branch_stats['Significant'].to_numpy()
+            ax.scatter(dates[significant], branch_stats['mean'][significant], s=250, marker='*',
+                       color=line[0].get_color(), edgecolor='black', zorder=3)
+
+        ax.set_title(f"{metric} Trend - {run_type} ({location}) - {folder}\n(star: significant shift from the previous campaign)",
+                     fontsize=16)
+        ax.set_xlabel('Campaign', fontsize=14)
+        ax.set_ylabel(f"{metric} (S.E.M.)", fontsize=14)
+        ax.grid(True, linestyle='--', alpha=0.7)
+        ax.legend(title='branch', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=11)
+        fig.autofmt_xdate()
+        fig.tight_layout()
+        filepath = os.path.join(output_dir, f"Trend_{run_type}_{location}_{folder}.svg")
+        filepath = save_figure(fig, filepath, dpi=300, bbox_inches='tight')
+        print(f"Saved plot to {filepath}")
+
+
+def add_arguments(parser):
+    parser.add_argument('directory', nargs='+',
+                        help='Results roots containing <run type>_<timestamp>/<model>/scheduleq.csv')
+    parser.add_argument('--model', help='Only analyze model directories containing this keyword')
+    parser.add_argument('--svg', choices=SVG_PROFILES, default='default',
+                        help='SVG output profile: lean (text as text, simplified paths, rounded coordinates) or svgz (lean and gzipped)')
+    parser.add_argument('--metric', default=RUNTIME, help=f'Metric to track (default {RUNTIME})')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='Significance level of the shift between consecutive campaigns (default 0.05)')
+    parser.add_argument('--workers', type=int, help='Number of result files read at once')
+
+
+def run(args):
+    set_svg_profile(args.svg)
+    partials = archive_stats(args.directory, args.metric, args.model, args.workers)
+    if partials is None:
+        print("No result CSVs found. Check if the CSV files are in the expected locations.")
+        return
+
+    # Output goes to the first root
+    output_dir = os.path.join(args.directory[0], 'Trend')
+    os.makedirs(output_dir, exist_ok=True)
+
+    shifts = campaign_shifts(campaign_stats(partials), args.alpha)
+
+    with open(os.path.join(output_dir, 'trend_data.txt'), 'w') as f:
+        f.write(f"{args.metric} per campaign and shift from the previous campaign (Welch's t-test)\n\n")
+        f.write(shifts.reset_index().to_string(index=False))
+        f.write("\n")
+
+    significant = shifts[shifts['Significant']]
+    if significant.empty:
+        print(f"No significant shifts at alpha = {args.alpha}")
+    else:
+        print(f"Significant shifts at alpha = {args.alpha}:")
+        print(significant[['Previous_Mean', 'mean', 'Change', 'p_value']].to_string())
+
+    plot_trend(shifts, args.metric, output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=HELP)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()